@@ -0,0 +1,16 @@
+import multiprocessing
+import os
+
+# Run from backend/: gunicorn -c gunicorn.conf.py server:app
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+accesslog = os.environ.get("ACCESS_LOG")
+# Only these peers may set the client address through X-Forwarded-For; list the reverse proxies here
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# Workers are forked after this file is read, so these become their defaults
+os.environ.setdefault("INVALIDATION_BUS_ENABLED", "true")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
@@ -1,26 +1,359 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import CursorType, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
 import os
+import asyncio
+import base64
+import csv
+import hashlib
+import inspect
+import io
+import math
+import random
+import json
 import logging
+import socket
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
+from typing import List, Literal, Optional, Tuple
+from enum import Enum
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 from passlib.context import CryptContext
+import httpx
 import jwt
+import orjson
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', 'false').lower() == 'true'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_LAG_BUCKETS = (0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
 
-app = FastAPI()
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = [
+            f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class RequestStats:
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.source = "handler"
+        self.timings = {}
+        self.db_calls = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return route.path if route else "unmatched"
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = [f"{source};dur={seconds * 1000:.1f}" for source, seconds in self.timings.items()]
+        entries.append(f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_calls} round trips"')
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}
+        self.db_commands = {}
+        self.pool = {}
+        self.pool_checkout_failures = {}
+        self.jobs = {}
+        self.job_durations = {}
+        self.job_lag = {}
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float):
+        with self.lock:
+            key = (method, route, status_code)
+            if key not in self.requests:
+                self.requests[key] = Histogram()
+            self.requests[key].observe(seconds)
+
+    def observe_db_command(self, route: str, source: str, command: str, seconds: float, documents: int):
+        with self.lock:
+            totals = self.db_commands.setdefault((route, source, command), [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += documents
+
+    def observe_pool(self, address: str, field: int, delta: int):
+        with self.lock:
+            self.pool.setdefault(address, [0, 0, 0])[field] += delta
+
+    def observe_checkout_failure(self, address: str, reason: str):
+        with self.lock:
+            key = (address, reason)
+            self.pool_checkout_failures[key] = self.pool_checkout_failures.get(key, 0) + 1
+
+    def observe_job_outcome(self, job_type: str, outcome: str):
+        with self.lock:
+            key = (job_type, outcome)
+            self.jobs[key] = self.jobs.get(key, 0) + 1
+
+    def observe_job_run(self, job_type: str, seconds: float, lag: float):
+        with self.lock:
+            if job_type not in self.job_durations:
+                self.job_durations[job_type] = Histogram()
+                self.job_lag[job_type] = Histogram(JOB_LAG_BUCKETS)
+            self.job_durations[job_type].observe(seconds)
+            self.job_lag[job_type].observe(lag)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            for (method, route, status_code), histogram in sorted(self.requests.items()):
+                labels = f'method="{method}",route="{route}",status="{status_code}"'
+                lines.extend(histogram.render("http_request_duration_seconds", labels))
+            db_commands = sorted(self.db_commands.items())
+            pool = sorted(self.pool.items())
+            pool_checkout_failures = sorted(self.pool_checkout_failures.items())
+            jobs = sorted(self.jobs.items())
+            job_histograms = [
+                "# HELP job_duration_seconds Time spent running background jobs by type.",
+                "# TYPE job_duration_seconds histogram",
+            ]
+            for job_type, histogram in sorted(self.job_durations.items()):
+                job_histograms.extend(histogram.render("job_duration_seconds", f'type="{job_type}"'))
+            job_histograms.extend([
+                "# HELP job_lag_seconds Delay between a job becoming due and a worker starting it.",
+                "# TYPE job_lag_seconds histogram",
+            ])
+            for job_type, histogram in sorted(self.job_lag.items()):
+                job_histograms.extend(histogram.render("job_lag_seconds", f'type="{job_type}"'))
+        
+        for name, index, kind, help_text in (
+            ("mongo_commands_total", 0, "counter", "Mongo round trips by route, caller and command."),
+            ("mongo_command_seconds_total", 1, "counter", "Time spent in Mongo commands."),
+            ("mongo_documents_returned_total", 2, "counter", "Documents returned by Mongo commands."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (route, source, command), totals in db_commands:
+                lines.append(f'{name}{{route="{route}",source="{source}",command="{command}"}} {totals[index]}')
+        
+        lines.extend([
+            "# HELP mongo_pool_max_size Configured maxPoolSize per server.",
+            "# TYPE mongo_pool_max_size gauge",
+            f"mongo_pool_max_size {MONGO_MAX_POOL_SIZE}",
+        ])
+        for name, index, help_text in (
+            ("mongo_pool_connections", 0, "Open pooled connections by server."),
+            ("mongo_pool_checked_out", 1, "Connections currently checked out by server."),
+            ("mongo_pool_wait_queue", 2, "Operations waiting for a pooled connection by server."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for address, gauges in pool:
+                lines.append(f'{name}{{address="{address}"}} {gauges[index]}')
+        lines.append("# HELP mongo_pool_checkout_failures_total Failed connection checkouts by server and reason.")
+        lines.append("# TYPE mongo_pool_checkout_failures_total counter")
+        for (address, reason), count in pool_checkout_failures:
+            lines.append(f'mongo_pool_checkout_failures_total{{address="{address}",reason="{reason}"}} {count}')
+        
+        lines.append("# HELP jobs_total Background jobs by type and outcome.")
+        lines.append("# TYPE jobs_total counter")
+        for (job_type, outcome), count in jobs:
+            lines.append(f'jobs_total{{type="{job_type}",outcome="{outcome}"}} {count}')
+        lines.extend(job_histograms)
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+@contextmanager
+def instrument(source: str):
+    stats = request_stats.get()
+    if stats is None:
+        yield
+        return
+    previous = stats.source
+    stats.source = source
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.source = previous
+        stats.timings[source] = stats.timings.get(source, 0.0) + time.perf_counter() - start
+
+def documents_returned(reply: dict) -> int:
+    cursor = reply.get('cursor')
+    if cursor:
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    if reply.get('value') is not None:
+        return 1
+    return 0
+
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.record(event.command_name, event.duration_micros / 1e6, documents_returned(event.reply))
+
+    def failed(self, event):
+        self.record(event.command_name, event.duration_micros / 1e6, 0)
+
+    def record(self, command: str, seconds: float, documents: int):
+        stats = request_stats.get()
+        route, source = "background", "background"
+        if stats is not None:
+            route, source = stats.route, stats.source
+            stats.db_calls += 1
+            stats.db_seconds += seconds
+        metrics.observe_db_command(route, source, command, seconds, documents)
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        stats = RequestStats(scope)
+        stats_token = request_stats.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+        
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if METRICS_SERVER_TIMING:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", stats.server_timing(time.perf_counter() - start))
+            await send(message)
+        
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.in_flight -= 1
+            metrics.observe_request(scope["method"], stats.route, status_code, time.perf_counter() - start)
+            request_stats.reset(stats_token)
+
+POOL_CONNECTIONS, POOL_CHECKED_OUT, POOL_WAIT_QUEUE = range(3)
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        metrics.observe_pool(self.address(event), POOL_CONNECTIONS, 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        metrics.observe_pool(self.address(event), POOL_CONNECTIONS, -1)
+
+    def connection_check_out_started(self, event):
+        metrics.observe_pool(self.address(event), POOL_WAIT_QUEUE, 1)
+
+    def connection_check_out_failed(self, event):
+        metrics.observe_pool(self.address(event), POOL_WAIT_QUEUE, -1)
+        metrics.observe_checkout_failure(self.address(event), str(event.reason))
+
+    def connection_checked_out(self, event):
+        metrics.observe_pool(self.address(event), POOL_WAIT_QUEUE, -1)
+        metrics.observe_pool(self.address(event), POOL_CHECKED_OUT, 1)
+
+    def connection_checked_in(self, event):
+        metrics.observe_pool(self.address(event), POOL_CHECKED_OUT, -1)
+
+    @staticmethod
+    def address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 0)) or None
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+MONGO_WARMUP_CONNECTIONS = int(os.environ.get('MONGO_WARMUP_CONNECTIONS', MONGO_MIN_POOL_SIZE))
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    options = {}
+    if MONGO_COMPRESSORS:
+        options['compressors'] = MONGO_COMPRESSORS
+    return AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        tz_aware=True,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        readPreference=MONGO_READ_PREFERENCE,
+        event_listeners=[MongoCommandListener(), MongoPoolListener()],
+        **options
+    )
+
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -28,7 +361,350 @@ security = HTTPBearer()
 
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', 15))
+REFRESH_TOKEN_EXPIRE_MINUTES = int(os.environ.get('REFRESH_TOKEN_EXPIRE_MINUTES', 60 * 24 * 7))
+REVOCATION_POLL_SECONDS = float(os.environ.get('REVOCATION_POLL_SECONDS', 2))
+REVOCATION_SYNC_OVERLAP_SECONDS = 10
+
+BOOKINGS_PAGE_SIZE = 100
+BOOKINGS_MAX_PAGE_SIZE = 1000
+BOOKINGS_STREAM_BATCH_SIZE = 500
+BOOKING_EXPORT_COLUMNS = [
+    "id", "user_id", "user_email", "user_name", "service_id", "service_name", "booking_date",
+    "booking_time", "address", "phone", "notes", "status", "created_at"
+]
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+IMPORT_MAX_ERRORS = 1000
+IMPORT_STRING_FIELDS = ("id", "user_id", "user_email", "created_at")
+MIGRATION_BATCH_SIZE = 1000
+LOCK_TTL_SECONDS = 600
+MIGRATION_WAIT_SECONDS = 1
+STORAGE_SCHEMA_VERSION = 2
+STORAGE_VALIDATION = os.environ.get('STORAGE_VALIDATION', 'true').lower() == 'true'
+BOOKINGS_SORT = [("created_at", -1), ("id", -1)]
+BOOKING_DERIVED_FIELDS = frozenset({"user_email", "user_name", "service_name"})
+BOOKING_PROJECTION = {"_id": 0, "slots": 0, "geo_pending": 0}
+
+SLOT_MINUTES = int(os.environ.get('SLOT_MINUTES', 30))
+SLOT_CAPACITY = int(os.environ.get('SLOT_CAPACITY', 3))
+BUSINESS_OPEN = os.environ.get('BUSINESS_OPEN', '08:00')
+BUSINESS_CLOSE = os.environ.get('BUSINESS_CLOSE', '18:00')
+AVAILABILITY_MAX_DAYS = 31
+BULK_STATUS_BATCH_SIZE = 1000
+
+ARCHIVE_ENABLED = os.environ.get('ARCHIVE_ENABLED', 'true').lower() == 'true'
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', 3600))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+ARCHIVED_STATUSES = ["completed", "cancelled"]
+
+JOB_WORKER_MODE = os.environ.get('JOB_WORKER_MODE', 'inprocess')
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', 4))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 1))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 60))
+JOB_TIMEOUT_SECONDS = float(os.environ.get('JOB_TIMEOUT_SECONDS', 30))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_BACKOFF_BASE_SECONDS = float(os.environ.get('JOB_BACKOFF_BASE_SECONDS', 2))
+JOB_BACKOFF_MAX_SECONDS = float(os.environ.get('JOB_BACKOFF_MAX_SECONDS', 600))
+
+NOTIFICATION_TRANSPORT = os.environ.get('NOTIFICATION_TRANSPORT', 'fake')
+NOTIFICATION_FAKE_FAILURE_RATE = float(os.environ.get('NOTIFICATION_FAKE_FAILURE_RATE', 0))
+
+BOOKING_EVENTS_SOURCE = os.environ.get('BOOKING_EVENTS_SOURCE', 'auto')
+BOOKING_EVENTS_BUFFER_SIZE = int(os.environ.get('BOOKING_EVENTS_BUFFER_SIZE', 1000))
+BOOKING_EVENTS_QUEUE_SIZE = int(os.environ.get('BOOKING_EVENTS_QUEUE_SIZE', 1000))
+BOOKING_EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('BOOKING_EVENTS_HEARTBEAT_SECONDS', 15))
+BOOKING_EVENTS_RETRY_MS = 3000
+
+INVALIDATION_BUS_ENABLED = os.environ.get('INVALIDATION_BUS_ENABLED', 'false').lower() == 'true'
+INVALIDATION_BUS_SIZE_BYTES = int(os.environ.get('INVALIDATION_BUS_SIZE_BYTES', 16 * 1024 * 1024))
+INVALIDATION_BUS_SEEN_SIZE = 1024
+
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 60 * 60 * 24))
+IDEMPOTENCY_LOCAL_TTL_SECONDS = float(os.environ.get('IDEMPOTENCY_LOCAL_TTL_SECONDS', 60))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000))
+IDEMPOTENCY_LEASE_SECONDS = float(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 60))
+
+idempotency_cache = TTLCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_LOCAL_TTL_SECONDS)
+
+GEOCODER = os.environ.get('GEOCODER', 'offline')
+GEOCODER_URL = os.environ.get('GEOCODER_URL', 'https://nominatim.openstreetmap.org/search')
+GEOCODER_USER_AGENT = os.environ.get('GEOCODER_USER_AGENT', 'cleanspace-dispatch')
+GEOCODER_TIMEOUT_SECONDS = float(os.environ.get('GEOCODER_TIMEOUT_SECONDS', 2))
+GEOCODER_OFFLINE_BBOX = os.environ.get('GEOCODER_OFFLINE_BBOX', '-74.05,40.68,-73.85,40.85')
+GEOCODE_CACHE_SIZE = int(os.environ.get('GEOCODE_CACHE_SIZE', 10000))
+GEOCODE_CACHE_TTL_SECONDS = float(os.environ.get('GEOCODE_CACHE_TTL_SECONDS', 60 * 60 * 24))
+EARTH_RADIUS_KM = 6378.1
+SEARCH_MAX_RADIUS_KM = 500
+SEARCH_MAX_USER_MATCHES = 1000
+
+def geo_point(longitude: float, latitude: float) -> dict:
+    return {"type": "Point", "coordinates": [round(longitude, 6), round(latitude, 6)]}
+
+class OfflineGeocoder:
+    # Deterministic stand-in: hashes the normalized address to a point inside a bounding box
+    remote = False
+
+    def __init__(self, bbox: str):
+        self.west, self.south, self.east, self.north = (float(value) for value in bbox.split(","))
+
+    async def geocode(self, address: str) -> Optional[dict]:
+        digest = hashlib.sha256(normalize_address(address).encode()).digest()
+        x = int.from_bytes(digest[:8], "big") / 2 ** 64
+        y = int.from_bytes(digest[8:16], "big") / 2 ** 64
+        return geo_point(self.west + x * (self.east - self.west), self.south + y * (self.north - self.south))
+
+    async def close(self):
+        pass
+
+class NominatimGeocoder:
+    # Called from the location backfill job only; requests never wait on it
+    remote = True
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self._http = None
+
+    async def geocode(self, address: str) -> Optional[dict]:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout, headers={"User-Agent": GEOCODER_USER_AGENT})
+        response = await self._http.get(self.url, params={"q": address, "format": "jsonv2", "limit": 1})
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return geo_point(float(results[0]['lon']), float(results[0]['lat']))
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+GEOCODERS = {
+    "offline": lambda: OfflineGeocoder(GEOCODER_OFFLINE_BBOX),
+    "nominatim": lambda: NominatimGeocoder(GEOCODER_URL, GEOCODER_TIMEOUT_SECONDS),
+}
+geocoder = GEOCODERS[GEOCODER]()
+geocode_cache = TTLCache(GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL_SECONDS)
+
+def normalize_address(address: str) -> str:
+    return " ".join(address.lower().split())
+
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', PASSWORD_HASH_WORKERS * 8))
+
+if PASSWORD_HASH_EXECUTOR == 'process':
+    password_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+else:
+    password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_tasks_pending = 0
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+# Off by default: behind a proxy every request shares its address unless uvicorn resolves the client
+# from a trusted X-Forwarded-For (--proxy-headers --forwarded-allow-ips, FORWARDED_ALLOW_IPS under gunicorn)
+RATE_LIMIT_IP_ENABLED = os.environ.get('RATE_LIMIT_IP_ENABLED', 'false').lower() == 'true'
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+RATE_LIMIT_IP_BURST = int(os.environ.get('RATE_LIMIT_IP_BURST', 20))
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get('RATE_LIMIT_IP_PER_MINUTE', 30))
+RATE_LIMIT_EMAIL_BURST = int(os.environ.get('RATE_LIMIT_EMAIL_BURST', 5))
+RATE_LIMIT_EMAIL_PER_MINUTE = float(os.environ.get('RATE_LIMIT_EMAIL_PER_MINUTE', 5))
+
+class MemoryRateLimiter:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, burst: int, per_second: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * per_second)
+        allowed = tokens >= 1
+        self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return 0.0 if allowed else (1 - tokens) / per_second
+
+class MongoRateLimiter:
+    async def take(self, key: str, burst: int, per_second: float) -> float:
+        now = datetime.now(timezone.utc)
+        refilled = {"$add": [
+            {"$ifNull": ["$tokens", burst]},
+            {"$multiply": [{"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}, per_second]}
+        ]}
+        bucket = await db.rate_limits.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": {"$min": [burst, refilled]}, "updated_at": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": now + timedelta(seconds=burst / per_second)
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if bucket['allowed'] else (1 - bucket['tokens']) / per_second
+
+rate_limiter = MongoRateLimiter() if RATE_LIMIT_BACKEND == 'mongo' else MemoryRateLimiter(RATE_LIMIT_MAX_KEYS)
+
+background_tasks: List[asyncio.Task] = []
+
+DEFAULT_SERVICES = [
+    {
+        "id": "service-1",
+        "name": "Basic House Cleaning",
+        "description": "Standard cleaning of all rooms including dusting, vacuuming, mopping, and bathroom cleaning.",
+        "duration_minutes": 120,
+        "price": 89.99,
+        "image_url": "https://images.unsplash.com/photo-1597665863042-47e00964d899"
+    },
+    {
+        "id": "service-2",
+        "name": "Deep Cleaning",
+        "description": "Thorough cleaning including baseboards, inside appliances, windows, and hard-to-reach areas.",
+        "duration_minutes": 240,
+        "price": 179.99,
+        "image_url": "https://images.unsplash.com/photo-1759301495175-51e540735644"
+    },
+    {
+        "id": "service-3",
+        "name": "Office Cleaning",
+        "description": "Professional cleaning for office spaces including desks, common areas, restrooms, and kitchenettes.",
+        "duration_minutes": 180,
+        "price": 149.99,
+        "image_url": "https://images.unsplash.com/photo-1504297050568-910d24c426d3"
+    }
+]
+
+SERVICES_CACHE_CONTROL = os.environ.get('SERVICES_CACHE_CONTROL', 'public, max-age=60')
+
+INDEX_SELF_CHECK = os.environ.get('INDEX_SELF_CHECK', 'false').lower() == 'true'
+
+INDEXES = {
+    "services": [
+        ([("id", 1)], {"unique": True}),
+    ],
+    "users": [
+        ([("email", 1)], {"unique": True}),
+        ([("id", 1)], {"unique": True}),
+        ([("name", "text")], {"name": "users_text"}),
+    ],
+    "refresh_tokens": [
+        ([("jti", 1)], {"unique": True}),
+        ([("family", 1)], {}),
+        ([("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "jobs": [
+        ([("available_at", 1)], {}),
+        ([("status", 1), ("available_at", 1)], {}),
+    ],
+    "jobs_dead": [
+        ([("failed_at", -1)], {}),
+    ],
+    "rate_limits": [
+        ([("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "idempotency_keys": [
+        ([("created_at", 1)], {"expireAfterSeconds": IDEMPOTENCY_TTL_SECONDS}),
+    ],
+    "revoked_tokens": [
+        ([("revoked_at", 1)], {}),
+        ([("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "bookings": [
+        ([("id", 1)], {"unique": True}),
+        ([("user_id", 1), ("created_at", -1), ("id", -1)], {}),
+        ([("status", 1), ("booking_date", 1)], {}),
+        ([("created_at", -1), ("id", -1)], {}),
+        ([("location", "2dsphere"), ("booking_date", 1)], {}),
+        ([("geo_pending", 1)], {"sparse": True}),
+        ([("address", "text"), ("notes", "text")], {"name": "bookings_text"}),
+    ],
+    "bookings_archive": [
+        ([("id", 1)], {"unique": True}),
+        ([("user_id", 1), ("created_at", -1), ("id", -1)], {}),
+        ([("created_at", -1), ("id", -1)], {}),
+    ],
+}
+
+# Replaced by a wider index above; dropped at startup so writes stop maintaining them
+SUPERSEDED_INDEXES = {
+    "bookings": [[("user_id", 1), ("created_at", -1)]],
+    "bookings_archive": [[("user_id", 1), ("created_at", -1)]],
+}
+
+QUERY_SHAPES = [
+    ("users", {"email": "probe@example.com"}, None),
+    ("users", {"id": "probe"}, None),
+    ("bookings", {"id": "probe"}, None),
+    ("bookings", {"user_id": "probe"}, BOOKINGS_SORT),
+    ("bookings", {}, BOOKINGS_SORT),
+    ("bookings", {"status": "pending", "booking_date": {"$gte": "2000-01-01"}}, None),
+    ("bookings", {"status": {"$in": ARCHIVED_STATUSES}, "booking_date": {"$lt": "2000-01-01"}}, None),
+    ("bookings", {"location": {"$geoWithin": {"$centerSphere": [[0, 0], 0.001]}}, "booking_date": "2000-01-01"}, None),
+    ("bookings", {"geo_pending": {"$lte": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, None),
+    ("bookings", {"$text": {"$search": "probe"}}, None),
+    ("users", {"$text": {"$search": "probe"}}, None),
+    ("bookings_archive", {"user_id": "probe"}, BOOKINGS_SORT),
+    ("jobs", {"available_at": {"$lte": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, [("available_at", 1)]),
+    ("bookings_archive", {}, BOOKINGS_SORT),
+    ("slot_occupancy", {"_id": {"$gte": "2000-01-01", "$lte": "2000-01-31"}}, None),
+    ("refresh_tokens", {"jti": "probe"}, None),
+    ("refresh_tokens", {"family": "probe"}, None),
+    ("revoked_tokens", {"revoked_at": {"$gt": datetime(2000, 1, 1, tzinfo=timezone.utc)}}, [("revoked_at", 1)]),
+]
 
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -43,6 +719,9 @@ class UserCreate(BaseModel):
     password: str
     name: str
 
+class RoleUpdate(BaseModel):
+    role: Literal["user", "admin"]
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -51,6 +730,14 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     user: User
+    refresh_token: Optional[str] = None
+    expires_in: int = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 class Service(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -61,8 +748,18 @@ class Service(BaseModel):
     price: float
     image_url: str
 
+class BookingStatus(str, Enum):
+    pending = "pending"
+    confirmed = "confirmed"
+    completed = "completed"
+    cancelled = "cancelled"
+
+class GeoPoint(BaseModel):
+    type: Literal["Point"] = "Point"
+    coordinates: List[float] = Field(min_length=2, max_length=2)
+
 class Booking(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+    model_config = ConfigDict(extra="ignore", use_enum_values=True, validate_default=True)
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     user_email: str
@@ -74,204 +771,2281 @@ class Booking(BaseModel):
     address: str
     phone: str
     notes: Optional[str] = None
-    status: str = "pending"
+    location: Optional[GeoPoint] = None
+    status: BookingStatus = BookingStatus.pending
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-class BookingCreate(BaseModel):
+class SlotAvailability(BaseModel):
+    time: str
+    remaining: int
+
+class DayAvailability(BaseModel):
+    date: str
+    slots: List[SlotAvailability]
+
+class BookingStatusUpdate(BaseModel):
+    booking_id: str
+    status: BookingStatus
+
+class BookingStatusFilter(BaseModel):
+    status: Optional[BookingStatus] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    service_id: Optional[str] = None
+
+class BulkStatusUpdate(BaseModel):
+    updates: List[BookingStatusUpdate] = Field(default_factory=list, max_length=BULK_STATUS_BATCH_SIZE)
+    filter: Optional[BookingStatusFilter] = None
+    status: Optional[BookingStatus] = None
+
+class BulkStatusItemResult(BaseModel):
+    booking_id: str
+    result: Literal["updated", "unchanged", "not_found", "conflict"]
+
+class BulkStatusResult(BaseModel):
+    updated: int
+    results: List[BulkStatusItemResult]
+
+class BookingImportError(BaseModel):
+    row: int
+    error: str
+
+class BookingImportResult(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    errors: List[BookingImportError]
+    errors_truncated: bool = False
+
+class DeadJob(BaseModel):
+    id: str
+    type: str
+    payload: dict
+    attempts: int
+    last_error: str
+    created_at: datetime
+    failed_at: datetime
+
+class ServiceAnalytics(BaseModel):
     service_id: str
     service_name: str
+    count: int
+    revenue: float
+
+class DayAnalytics(BaseModel):
+    date: str
+    total: int
+    revenue: float
+
+class BookingAnalytics(BaseModel):
+    total: int
+    revenue: float
+    by_status: dict
+    by_service: List[ServiceAnalytics]
+    by_day: List[DayAnalytics]
+
+class BookingCreate(BaseModel):
+    service_id: str
+    service_name: Optional[str] = None
     booking_date: str
     booking_time: str
     address: str
     phone: str
     notes: Optional[str] = None
 
+class StorageSchema:
+    # Code works with model field names; stored documents use the short names and carry a version
+    FIELD_OPERATORS = {"$and", "$or", "$nor", "$set", "$unset", "$inc", "$setOnInsert"}
+
+    def __init__(self, model, fields: dict, optional: frozenset = frozenset(), derived: frozenset = frozenset()):
+        unmapped = set(model.model_fields) - set(fields) - derived
+        if unmapped:
+            raise ValueError(f"{model.__name__} fields without a storage name: {', '.join(sorted(unmapped))}")
+        self.version = STORAGE_SCHEMA_VERSION
+        self.derived = derived
+        self.short = {name: short for name, (short, _) in fields.items()}
+        self.long = {short: name for name, short in self.short.items()}
+        self.properties = {short: bson_schema for short, bson_schema in fields.values()}
+        self.required = [short for name, (short, _) in fields.items() if name not in optional]
+
+    def field(self, name: str) -> str:
+        head, dot, rest = name.partition(".")
+        if head in ("_id", "v"):
+            return name
+        return self.short[head] + dot + rest
+
+    def translate(self, spec):
+        if isinstance(spec, list):
+            return [self.translate(item) for item in spec]
+        return {
+            key if key.startswith("$") else self.field(key): self.translate(value) if key in self.FIELD_OPERATORS else value
+            for key, value in spec.items()
+        }
+
+    def sort(self, keys: List[tuple]) -> List[tuple]:
+        return [(self.field(key), direction) for key, direction in keys]
+
+    def to_doc(self, data: dict) -> dict:
+        doc = {self.field(key): value for key, value in data.items() if key not in self.derived}
+        doc['v'] = self.version
+        return doc
+
+    def from_doc(self, doc: dict) -> dict:
+        return {self.long[key]: value for key, value in doc.items() if key in self.long}
+
+    async def iterate(self, db_cursor):
+        async for doc in db_cursor:
+            yield self.from_doc(doc)
+
+    def upgrade(self, doc: dict) -> dict:
+        # Version 1 documents use the model field names and may hold ISO strings for datetimes
+        data = {key: value for key, value in doc.items() if key in self.short}
+        for key, value in data.items():
+            if isinstance(value, str) and self.properties[self.short[key]].get("bsonType") == "date":
+                value = datetime.fromisoformat(value)
+                data[key] = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return {"_id": doc['_id'], **self.to_doc(data)}
+
+    def validator(self) -> dict:
+        return {"$jsonSchema": {
+            "bsonType": "object",
+            "required": ["v", *self.required],
+            "properties": {"_id": {"bsonType": "objectId"}, "v": {"enum": [self.version]}, **self.properties},
+            "additionalProperties": False
+        }}
+
+users_storage = StorageSchema(
+    User,
+    {
+        "id": ("i", {"bsonType": "string"}),
+        "email": ("e", {"bsonType": "string"}),
+        "name": ("n", {"bsonType": "string"}),
+        "role": ("r", {"enum": ["user", "admin"]}),
+        "created_at": ("c", {"bsonType": "date"}),
+        "password": ("pw", {"bsonType": "string"}),
+    }
+)
+
+class BookingStorageSchema(StorageSchema):
+    def upgrade(self, doc: dict) -> dict:
+        upgraded = super().upgrade(doc)
+        if self.field("location") not in upgraded:
+            upgraded[self.field("geo_pending")] = datetime.now(timezone.utc)
+        return upgraded
+
+bookings_storage = BookingStorageSchema(
+    Booking,
+    {
+        "id": ("i", {"bsonType": "string"}),
+        "user_id": ("u", {"bsonType": "string"}),
+        "service_id": ("s", {"bsonType": "string"}),
+        "booking_date": ("d", {"bsonType": "string", "pattern": "^\\d{4}-\\d{2}-\\d{2}$"}),
+        "booking_time": ("t", {"bsonType": "string", "pattern": "^\\d{1,2}:\\d{2}"}),
+        "address": ("a", {"bsonType": "string"}),
+        "phone": ("p", {"bsonType": "string"}),
+        "notes": ("n", {"bsonType": ["string", "null"]}),
+        "location": ("l", {"bsonType": ["object", "null"]}),
+        "status": ("st", {"enum": [status.value for status in BookingStatus]}),
+        "created_at": ("c", {"bsonType": "date"}),
+        "slots": ("sl", {"bsonType": "array", "items": {"bsonType": "string"}}),
+        # Set while the location backfill still has to geocode the booking; a claim moves it into the future
+        "geo_pending": ("gp", {"bsonType": "date"}),
+    },
+    # Past and cancelled bookings from before slot tracking keep no slots; the upgrade counts the upcoming ones
+    optional=frozenset({"notes", "location", "slots", "geo_pending"}),
+    derived=BOOKING_DERIVED_FIELDS
+)
+
+STORAGE_SCHEMAS = {
+    "users": users_storage,
+    "bookings": bookings_storage,
+    "bookings_archive": bookings_storage,
+}
+
+class ServiceCatalog:
+    def __init__(self):
+        self.version = 0
+        self.services = []
+        self.by_id = {}
+        self.body = b"[]"
+        self.etag = '"empty"'
+
+    def load(self, services: List[dict]):
+        self.services = [Service(**service).model_dump() for service in services]
+        self.by_id = {service['id']: service for service in self.services}
+        self.body = json.dumps(self.services, separators=(",", ":")).encode()
+        self.etag = '"%s"' % hashlib.sha256(self.body).hexdigest()[:32]
+        self.version += 1
+
+service_catalog = ServiceCatalog()
+
+class BloomFilter:
+    def __init__(self, size_bits: int = 1 << 20, hashes: int = 4):
+        self.size_bits = size_bits
+        self.hashes = hashes
+        self.bits = bytearray(size_bits // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=8 * self.hashes).digest()
+        for i in range(self.hashes):
+            yield int.from_bytes(digest[i * 8:(i + 1) * 8], "little") % self.size_bits
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class RevocationList:
+    def __init__(self):
+        self.bloom = BloomFilter()
+        self.jtis = {}
+        self.not_before = {}
+        self.last_seen = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+    def apply(self, doc: dict):
+        if doc.get('jti'):
+            self.jtis[doc['jti']] = doc['expires_at']
+            self.bloom.add(doc['jti'])
+        if doc.get('user_id'):
+            self.not_before[doc['user_id']] = max(self.not_before.get(doc['user_id'], 0), doc['not_before'])
+
+    def prune(self):
+        now = datetime.now(timezone.utc)
+        expired = [jti for jti, expires_at in self.jtis.items() if expires_at <= now]
+        if expired:
+            for jti in expired:
+                del self.jtis[jti]
+            self.bloom = BloomFilter(self.bloom.size_bits, self.bloom.hashes)
+            for jti in self.jtis:
+                self.bloom.add(jti)
+        # Every token issued before an older cutoff has expired on its own
+        cutoff = time.time() - ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        for user_id in [user_id for user_id, not_before in self.not_before.items() if not_before <= cutoff]:
+            del self.not_before[user_id]
+
+    def is_revoked(self, payload: dict) -> bool:
+        jti = payload.get('jti')
+        if jti and jti in self.bloom and jti in self.jtis:
+            return True
+        not_before = self.not_before.get(payload.get('sub'))
+        return not_before is not None and payload.get('iat', 0) < not_before
+
+revocation_list = RevocationList()
+
+class BookingEventBus:
+    def __init__(self, size: int, queue_size: int):
+        self.source = "local"
+        self.epoch = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.queue_size = queue_size
+        self._events = deque(maxlen=size)
+        self._subscribers = set()
+
+    def publish(self, event_type: str, booking: dict, event_id: Optional[str] = None) -> str:
+        if event_id is None:
+            self.sequence += 1
+            event_id = f"{self.epoch}-{self.sequence}"
+        data = orjson.dumps({"type": event_type, "booking": booking}, default=str)
+        frame = b"id: " + event_id.encode() + b"\ndata: " + data + b"\n\n"
+        self._events.append((event_id, frame))
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # A stalled client is disconnected and catches up from the buffer via Last-Event-ID
+                self._disconnect(queue)
+        return event_id
+
+    def since(self, last_event_id: str) -> Optional[List[bytes]]:
+        for index, (event_id, _) in enumerate(self._events):
+            if event_id == last_event_id:
+                return [frame for _, frame in list(self._events)[index + 1:]]
+        return None
+
+    async def stream(self, last_event_id: Optional[str]):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        missed = self.since(last_event_id) if last_event_id else []
+        try:
+            yield f"retry: {BOOKING_EVENTS_RETRY_MS}\n\n".encode()
+            if missed is None:
+                yield b"data: " + orjson.dumps({"type": "reset"}) + b"\n\n"
+            else:
+                for frame in missed:
+                    yield frame
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), BOOKING_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self._subscribers.discard(queue)
+
+    def close(self):
+        for queue in list(self._subscribers):
+            self._disconnect(queue)
+
+    def _disconnect(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+booking_events = BookingEventBus(BOOKING_EVENTS_BUFFER_SIZE, BOOKING_EVENTS_QUEUE_SIZE)
+
+class InvalidationBus:
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.enabled = False
+        self.handlers = {}
+        self.last_id = None
+        self._seen = OrderedDict()
+
+    def subscribe(self, topic: str, handler):
+        self.handlers.setdefault(topic, []).append(handler)
+
+    async def publish(self, topic: str, key: Optional[str] = None, payload: Optional[dict] = None):
+        await self.publish_many(topic, [(key, payload)])
+
+    async def publish_many(self, topic: str, messages: List[Tuple[Optional[str], Optional[dict]]]):
+        if not self.enabled or not messages:
+            return
+        now = datetime.now(timezone.utc)
+        try:
+            await db.invalidations.insert_many([
+                {"topic": topic, "key": key, "payload": payload, "origin": self.worker_id, "published_at": now}
+                for key, payload in messages
+            ])
+        except Exception:
+            # The write itself succeeded; peers converge through their TTLs and polling
+            logger.exception("Failed to publish %s invalidations", topic)
+
+    async def start(self):
+        try:
+            await db.create_collection("invalidations", capped=True, size=INVALIDATION_BUS_SIZE_BYTES)
+        except CollectionInvalid:
+            pass
+        except OperationFailure as e:
+            # NamespaceExists: another worker created it after pymongo's existence check
+            if e.code != 48:
+                raise
+        last = await db.invalidations.find_one({}, sort=[("$natural", -1)])
+        if last is None:
+            # A tailable cursor on an empty capped collection dies immediately
+            result = await db.invalidations.insert_one({"topic": "noop", "origin": self.worker_id, "published_at": datetime.now(timezone.utc)})
+            last = {"_id": result.inserted_id}
+        self.last_id = last['_id']
+        self.enabled = True
+
+    async def tail(self):
+        while True:
+            try:
+                # ObjectIds from different processes only order to the second, so reopen with overlap and dedupe
+                since = ObjectId.from_datetime(self.last_id.generation_time - timedelta(seconds=1))
+                cursor = db.invalidations.find({"_id": {"$gt": since}}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for message in cursor:
+                        await self.dispatch(message)
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Invalidation bus cursor failed, reopening")
+                await asyncio.sleep(1)
+
+    async def dispatch(self, message: dict):
+        if message['_id'] in self._seen:
+            return
+        self._seen[message['_id']] = None
+        while len(self._seen) > INVALIDATION_BUS_SEEN_SIZE:
+            self._seen.popitem(last=False)
+        self.last_id = max(self.last_id, message['_id'])
+        if message.get('origin') == self.worker_id:
+            return
+        for handler in self.handlers.get(message['topic'], []):
+            try:
+                result = handler(message)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Invalidation handler for %s failed", message['topic'])
+
+invalidation_bus = InvalidationBus()
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def parse_time_minutes(value: str) -> int:
+    try:
+        hours, minutes = value.split(":")[:2]
+        total = int(hours) * 60 + int(minutes)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {value}")
+    if not 0 <= total < 24 * 60:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {value}")
+    return total
+
+def format_time_minutes(total: int) -> str:
+    return f"{total // 60:02d}:{total % 60:02d}"
+
+def parse_booking_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+def business_slots() -> List[str]:
+    return [
+        format_time_minutes(minutes)
+        for minutes in range(parse_time_minutes(BUSINESS_OPEN), parse_time_minutes(BUSINESS_CLOSE), SLOT_MINUTES)
+    ]
+
+def booking_slots(booking_time: str, duration_minutes: int) -> List[str]:
+    start = parse_time_minutes(booking_time)
+    end = start + duration_minutes
+    if start < parse_time_minutes(BUSINESS_OPEN) or end > parse_time_minutes(BUSINESS_CLOSE):
+        raise HTTPException(status_code=400, detail="Booking time is outside business hours")
+    first = start - start % SLOT_MINUTES
+    return [format_time_minutes(minutes) for minutes in range(first, end, SLOT_MINUTES)]
+
+async def reserve_slots(booking_date: str, slots: List[str]) -> bool:
+    # Create the day first: a capacity-checked upsert would turn a lost insert race into a false "fully booked"
+    try:
+        await db.slot_occupancy.update_one({"_id": booking_date}, {"$setOnInsert": {"slots": {}}}, upsert=True)
+    except DuplicateKeyError:
+        pass
+    query = {"_id": booking_date}
+    for slot in slots:
+        query[f"slots.{slot}"] = {"$not": {"$gte": SLOT_CAPACITY}}
+    result = await db.slot_occupancy.update_one(query, {"$inc": {f"slots.{slot}": 1 for slot in slots}})
+    return result.modified_count == 1
+
+async def release_slots(booking_date: str, slots: List[str]):
+    if slots:
+        await db.slot_occupancy.update_one({"_id": booking_date}, {"$inc": {f"slots.{slot}": -1 for slot in slots}})
+
+def rollup_increments(booking: dict, old_status: Optional[str], new_status: Optional[str]) -> dict:
+    service = service_catalog.by_id.get(booking['service_id'])
+    price = service['price'] if service else 0.0
+    service_key = f"services.{booking['service_id']}"
+    increments = {}
+    
+    def inc(field, amount):
+        increments[field] = increments.get(field, 0) + amount
+    
+    if old_status is None:
+        inc("total", 1)
+        inc(f"{service_key}.count", 1)
+    else:
+        inc(f"statuses.{old_status}", -1)
+    if new_status is None:
+        inc("total", -1)
+        inc(f"{service_key}.count", -1)
+    else:
+        inc(f"statuses.{new_status}", 1)
+    
+    billable_delta = (new_status not in (None, "cancelled")) - (old_status not in (None, "cancelled"))
+    if billable_delta:
+        inc("revenue", billable_delta * price)
+        inc(f"{service_key}.revenue", billable_delta * price)
+    return increments
+
+async def update_rollups(changes: List[Tuple[dict, Optional[str], Optional[str]]]):
+    per_day = {}
+    for booking, old_status, new_status in changes:
+        day = per_day.setdefault(booking['booking_date'], {})
+        for field, amount in rollup_increments(booking, old_status, new_status).items():
+            day[field] = day.get(field, 0) + amount
+    operations = [
+        UpdateOne({"_id": day}, {"$inc": increments}, upsert=True)
+        for day, increments in per_day.items()
+        if any(increments.values())
+    ]
+    if operations:
+        await db.booking_rollups.bulk_write(operations, ordered=False)
+
+@asynccontextmanager
+async def mongo_lock(name: str, ttl_seconds: float = LOCK_TTL_SECONDS):
+    # Yields whether this process holds the lock; an expired holder is taken over
+    now = datetime.now(timezone.utc)
+    token = uuid.uuid4().hex
+    try:
+        await db.locks.update_one(
+            {"_id": name, "expires_at": {"$lte": now}},
+            {"$set": {"token": token, "owner": invalidation_bus.worker_id, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        acquired = True
+    except DuplicateKeyError:
+        acquired = False
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            await db.locks.delete_one({"_id": name, "token": token})
+
+async def rebuild_rollups():
+    field = bookings_storage.field
+    groups = []
+    for collection in (db.bookings, db.bookings_archive):
+        groups.extend(await collection.aggregate([
+            {"$group": {
+                "_id": {"date": f"${field('booking_date')}", "status": f"${field('status')}", "service_id": f"${field('service_id')}"},
+                "count": {"$sum": 1}
+            }}
+        ]).to_list(None))
+    
+    rollups = {}
+    for group in groups:
+        key = group['_id']
+        service = service_catalog.by_id.get(key['service_id'])
+        price = service['price'] if service else 0.0
+        revenue = 0.0 if key['status'] == "cancelled" else price * group['count']
+        day = rollups.setdefault(key['date'], {"_id": key['date'], "total": 0, "revenue": 0.0, "statuses": {}, "services": {}})
+        day['total'] += group['count']
+        day['revenue'] += revenue
+        day['statuses'][key['status']] = day['statuses'].get(key['status'], 0) + group['count']
+        service_totals = day['services'].setdefault(key['service_id'], {"count": 0, "revenue": 0.0})
+        service_totals['count'] += group['count']
+        service_totals['revenue'] += revenue
+    
+    # Replace day by day so readers never see an empty collection. This is not isolated from live writes:
+    # an $inc that lands between the aggregation and its day's replace is lost, and one for a booking the
+    # aggregation already counted is applied twice. Rebuild while bookings are quiet, or rebuild again after.
+    if rollups:
+        await db.booking_rollups.bulk_write(
+            [ReplaceOne({"_id": day}, rollup, upsert=True) for day, rollup in rollups.items()],
+            ordered=False
+        )
+    await db.booking_rollups.delete_many({"_id": {"$nin": list(rollups)}})
+    logger.info("Rebuilt booking rollups for %d days", len(rollups))
+
+async def adjust_slots_bulk(bookings: List[dict], delta: int):
+    increments = {}
+    for booking in bookings:
+        day = increments.setdefault(booking['booking_date'], {})
+        for slot in booking.get('slots') or []:
+            day[f"slots.{slot}"] = day.get(f"slots.{slot}", 0) + delta
+    operations = [UpdateOne({"_id": day}, {"$inc": inc}, upsert=delta > 0) for day, inc in increments.items() if inc]
+    if operations:
+        await db.slot_occupancy.bulk_write(operations, ordered=False)
+
+async def release_slots_bulk(bookings: List[dict]):
+    await adjust_slots_bulk(bookings, -1)
+
+async def apply_status_updates(updates: List[Tuple[str, str]]) -> List[BulkStatusItemResult]:
+    targets = dict(updates)
+    existing = {
+        booking['id']: booking
+        for booking in map(bookings_storage.from_doc, await db.bookings.find(
+            bookings_storage.translate({"id": {"$in": list(targets)}}),
+            bookings_storage.translate({"_id": 0, "id": 1, "status": 1, "booking_date": 1, "service_id": 1, "slots": 1})
+        ).to_list(None))
+    }
+    
+    results = {}
+    pending = []
+    for booking_id, new_status in targets.items():
+        booking = existing.get(booking_id)
+        if booking is None:
+            results[booking_id] = "not_found"
+        elif booking['status'] == new_status:
+            results[booking_id] = "unchanged"
+        elif booking['status'] == "cancelled" and booking.get('slots') and not await reserve_slots(booking['booking_date'], booking['slots']):
+            results[booking_id] = "conflict"
+        else:
+            pending.append(booking)
+    
+    if pending:
+        result = await db.bookings.bulk_write(
+            [
+                UpdateOne(
+                    bookings_storage.translate({"id": b['id'], "status": b['status']}),
+                    bookings_storage.translate({"$set": {"status": targets[b['id']]}})
+                )
+                for b in pending
+            ],
+            ordered=False
+        )
+        applied = {b['id'] for b in pending}
+        if result.matched_count < len(pending):
+            current = map(bookings_storage.from_doc, await db.bookings.find(
+                bookings_storage.translate({"id": {"$in": list(applied)}}), bookings_storage.translate({"_id": 0, "id": 1, "status": 1})
+            ).to_list(None))
+            applied = {b['id'] for b in current if b['status'] == targets[b['id']]}
+        
+        for booking in pending:
+            results[booking['id']] = "updated" if booking['id'] in applied else "conflict"
+        
+        await release_slots_bulk([
+            b for b in pending
+            if b['id'] in applied and targets[b['id']] == "cancelled"
+        ] + [
+            b for b in pending
+            if b['id'] not in applied and b['status'] == "cancelled"
+        ])
+        await update_rollups([(b, b['status'], targets[b['id']]) for b in pending if b['id'] in applied])
+        await publish_booking_events([
+            booking_status_event(b['id'], targets[b['id']]) for b in pending if b['id'] in applied
+        ])
+    
+    return [BulkStatusItemResult(booking_id=booking_id, result=results[booking_id]) for booking_id in targets]
+
+async def transition_booking_status(booking: dict, new_status: str) -> bool:
+    old_status = booking['status']
+    slots = booking.get('slots')
+    reopening = old_status == "cancelled" and new_status != "cancelled"
+    
+    if reopening and slots and not await reserve_slots(booking['booking_date'], slots):
+        raise HTTPException(status_code=409, detail="Selected time slot is fully booked")
+    
+    result = await db.bookings.update_one(
+        bookings_storage.translate({"id": booking['id'], "status": old_status}),
+        bookings_storage.translate({"$set": {"status": new_status}})
+    )
+    if result.matched_count == 0:
+        if reopening:
+            await release_slots(booking['booking_date'], slots)
+        return False
+    
+    if new_status == "cancelled" and old_status != "cancelled":
+        await release_slots(booking['booking_date'], slots)
+    await update_rollups([(booking, old_status, new_status)])
+    await publish_booking_events([booking_status_event(booking['id'], new_status)])
+    return True
+
+def booking_status_event(booking_id: str, status: str) -> Tuple[str, dict]:
+    return ("cancelled" if status == "cancelled" else "updated"), {"id": booking_id, "status": status}
+
+async def publish_booking_events(events: List[Tuple[str, dict]]):
+    if booking_events.source != "local":
+        return
+    await invalidation_bus.publish_many("booking_events", [
+        (booking_events.publish(event_type, booking), {"type": event_type, "booking": booking})
+        for event_type, booking in events
+    ])
+
+async def booking_event_from_change(change: dict) -> Optional[Tuple[str, dict]]:
+    if change.get('fullDocument') is None:
+        return None
+    doc = bookings_storage.from_doc(change['fullDocument'])
+    if change['ns']['coll'] == "bookings_archive":
+        return "archived", {"id": doc['id']}
+    if change['operationType'] == "insert":
+        booking = {key: value for key, value in doc.items() if key != "slots"}
+        return "created", (await hydrate_bookings([booking]))[0]
+    if change['operationType'] == "update":
+        status = change['updateDescription']['updatedFields'].get(bookings_storage.field('status'))
+        if status is None:
+            return None
+    else:
+        status = doc['status']
+    return booking_status_event(doc['id'], status)
+
+async def watch_booking_changes():
+    pipeline = [{"$match": {
+        "ns.coll": {"$in": ["bookings", "bookings_archive"]},
+        "operationType": {"$in": ["insert", "update", "replace"]}
+    }}]
+    resume_token = None
+    while True:
+        try:
+            async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as change_stream:
+                async for change in change_stream:
+                    resume_token = change['_id']
+                    event = await booking_event_from_change(change)
+                    if event is not None:
+                        booking_events.publish(*event, event_id=resume_token['_data'])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Booking change stream failed, reopening")
+            await asyncio.sleep(1)
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def create_access_token(data: dict) -> str:
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+async def run_password_task(fn, *args):
+    global password_tasks_pending
+    if password_tasks_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    
+    password_tasks_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, fn, *args)
+    finally:
+        password_tasks_pending -= 1
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+async def enforce_rate_limits(request: Request, action: str, email: str):
+    if not RATE_LIMIT_ENABLED:
+        return
+    
+    buckets = [(f"{action}:email:{email.lower()}", RATE_LIMIT_EMAIL_BURST, RATE_LIMIT_EMAIL_PER_MINUTE)]
+    if RATE_LIMIT_IP_ENABLED:
+        buckets.append((f"{action}:ip:{client_ip(request)}", RATE_LIMIT_IP_BURST, RATE_LIMIT_IP_PER_MINUTE))
+    # Email first: a request already rejected for its account does not spend the shared IP budget
+    for key, burst, per_minute in buckets:
+        retry_after = await rate_limiter.take(key, burst, per_minute / 60)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts, please retry later",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+async def geocode_address(address: str, cached_only: bool = False) -> Optional[dict]:
+    # None means the address has no match (or is not cached); geocoder errors propagate so callers can retry
+    key = normalize_address(address)
+    location = geocode_cache.get(key)
+    if location is not None or cached_only:
+        return location
+    with instrument("geocode"):
+        location = await geocoder.geocode(address)
+    if location is not None:
+        geocode_cache.set(key, location)
+    return location
+
+async def hash_password_async(password: str) -> str:
+    return await run_password_task(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_task(verify_password, plain_password, hashed_password)
+
+def create_access_token(user: User) -> str:
+    to_encode = {
+        "sub": user.id,
+        "email": user.email,
+        "name": user.name,
+        "role": user.role,
+        "created_at": user.created_at.isoformat(),
+        "type": "access",
+        "jti": uuid.uuid4().hex,
+        "iat": time.time(),
+        "exp": datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    }
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+async def create_refresh_token(user_id: str, family: Optional[str] = None) -> str:
+    jti = uuid.uuid4().hex
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+    await db.refresh_tokens.insert_one({
+        "jti": jti,
+        "user_id": user_id,
+        "family": family or jti,
+        "used": False,
+        "expires_at": expires_at
+    })
+    return jwt.encode({"sub": user_id, "type": "refresh", "jti": jti, "exp": expires_at}, SECRET_KEY, algorithm=ALGORITHM)
+
+async def issue_tokens(user: User, family: Optional[str] = None) -> Token:
+    return Token(
+        access_token=create_access_token(user),
+        refresh_token=await create_refresh_token(user.id, family),
+        token_type="bearer",
+        user=user
+    )
+
+async def revoke_access_token(jti: str, expires_at: datetime):
+    doc = {"jti": jti, "revoked_at": datetime.now(timezone.utc), "expires_at": expires_at}
+    await db.revoked_tokens.insert_one(doc)
+    revocation_list.apply(doc)
+    await invalidation_bus.publish("revocations", payload=doc)
+
+async def revoke_user_tokens(user_id: str):
+    now = datetime.now(timezone.utc)
+    doc = {
+        "user_id": user_id,
+        "not_before": time.time(),
+        "revoked_at": now,
+        "expires_at": now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    }
+    await db.revoked_tokens.insert_one(doc)
+    revocation_list.apply(doc)
+    await invalidation_bus.publish("revocations", payload=doc)
+
+async def sync_revocations():
+    docs = await db.revoked_tokens.find(
+        {"revoked_at": {"$gt": revocation_list.last_seen - timedelta(seconds=REVOCATION_SYNC_OVERLAP_SECONDS)}},
+        {"_id": 0}
+    ).sort("revoked_at", 1).to_list(None)
+    for doc in docs:
+        revocation_list.apply(doc)
+    if docs:
+        revocation_list.last_seen = max(revocation_list.last_seen, docs[-1]['revoked_at'])
+    revocation_list.prune()
+
+async def poll_revocations():
+    while True:
+        await asyncio.sleep(REVOCATION_POLL_SECONDS)
+        try:
+            await sync_revocations()
+        except Exception:
+            logger.exception("Failed to sync token revocations")
+
+def encode_bookings_cursor(booking: dict) -> str:
+    raw = json.dumps([booking['created_at'].isoformat(), booking['id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_bookings_cursor(cursor: str) -> tuple:
+    try:
+        created_at, booking_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(created_at)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, booking_id
+
+def build_bookings_query(
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    service_id: Optional[str] = None,
+    cursor: Optional[str] = None
+) -> dict:
+    query = {}
+    if status:
+        query['status'] = status
+    if service_id:
+        query['service_id'] = service_id
+    if date_from or date_to:
+        query['booking_date'] = {}
+        if date_from:
+            query['booking_date']['$gte'] = date_from
+        if date_to:
+            query['booking_date']['$lte'] = date_to
+    if cursor:
+        created_at, booking_id = decode_bookings_cursor(cursor)
+        query['$or'] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": booking_id}}
+        ]
+    return query
+
+async def hydrate_bookings(bookings: List[dict]) -> List[dict]:
+    users = {}
+    missing = set()
+    for booking in bookings:
+        user_id = booking['user_id']
+        if user_id not in users and user_id not in missing:
+            user = user_cache.get(user_id)
+            if user is None:
+                missing.add(user_id)
+            else:
+                users[user_id] = user
+    
+    if missing:
+        user_docs = await db.users.find(
+            users_storage.translate({"id": {"$in": list(missing)}}), users_storage.translate({"_id": 0, "password": 0})
+        ).to_list(None)
+        for user_doc in user_docs:
+            user = User(**users_storage.from_doc(user_doc))
+            user_cache.set(user.id, user)
+            users[user.id] = user
+    
+    for booking in bookings:
+        user = users.get(booking['user_id'])
+        service = service_catalog.by_id.get(booking['service_id'])
+        booking['user_email'] = user.email if user else ""
+        booking['user_name'] = user.name if user else ""
+        booking['service_name'] = service['name'] if service else ""
+    return bookings
+
+def booking_sort_key(booking: dict) -> tuple:
+    return booking['created_at'], booking['id']
+
+async def merge_bookings_cursors(*cursors):
+    heads = {}
+    for index, db_cursor in enumerate(cursors):
+        doc = await anext(db_cursor, None)
+        if doc is not None:
+            heads[index] = doc
+    while heads:
+        index = max(heads, key=lambda i: booking_sort_key(heads[i]))
+        yield heads[index]
+        doc = await anext(cursors[index], None)
+        if doc is None:
+            del heads[index]
+        else:
+            heads[index] = doc
+
+async def find_bookings_page(collection, query: dict, limit: int) -> List[dict]:
+    docs = await collection.find(
+        bookings_storage.translate(query), bookings_storage.translate(BOOKING_PROJECTION)
+    ).sort(bookings_storage.sort(BOOKINGS_SORT)).limit(limit).to_list(limit)
+    return [bookings_storage.from_doc(doc) for doc in docs]
+
+def find_bookings_sorted(query: dict, include_archived: bool = False):
+    collections = [db.bookings, db.bookings_archive] if include_archived else [db.bookings]
+    db_cursors = [
+        bookings_storage.iterate(
+            collection.find(bookings_storage.translate(query), bookings_storage.translate(BOOKING_PROJECTION))
+            .sort(bookings_storage.sort(BOOKINGS_SORT))
+            .batch_size(BOOKINGS_STREAM_BATCH_SIZE)
+        )
+        for collection in collections
+    ]
+    return merge_bookings_cursors(*db_cursors) if include_archived else db_cursors[0]
+
+def encode_bookings_ndjson(bookings: List[dict]) -> bytes:
+    return b"".join(orjson.dumps(booking, default=str) + b"\n" for booking in bookings)
+
+def encode_csv_rows(rows: List[list]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+def encode_bookings_csv(bookings: List[dict]) -> bytes:
+    rows = []
+    for booking in bookings:
+        coordinates = (booking.get('location') or {}).get('coordinates') or [None, None]
+        rows.append([
+            value.isoformat() if isinstance(value, datetime) else ("" if value is None else value)
+            for value in [booking.get(column) for column in BOOKING_EXPORT_COLUMNS] + coordinates
+        ])
+    return encode_csv_rows(rows)
+
+async def stream_bookings(db_cursor, encode_batch=encode_bookings_ndjson, preamble: bytes = b""):
+    if preamble:
+        yield preamble
+    batch = []
+    async for doc in db_cursor:
+        batch.append(doc)
+        if len(batch) >= BOOKINGS_STREAM_BATCH_SIZE:
+            yield encode_batch(await hydrate_bookings(batch))
+            batch = []
+    if batch:
+        yield encode_batch(await hydrate_bookings(batch))
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+    with instrument("get_current_user"):
+        return await authenticate_token(credentials.credentials)
+
+async def authenticate_token(token: str) -> User:
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
-        if user_id is None:
+        if user_id is None or payload.get("type", "access") != "access":
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
         
-        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
+        if revocation_list.is_revoked(payload):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        
+        if "role" in payload:
+            return User.model_construct(
+                id=user_id,
+                email=payload['email'],
+                name=payload['name'],
+                role=payload['role'],
+                created_at=datetime.fromisoformat(payload['created_at'])
+            )
+    
+        user = user_cache.get(user_id)
+        if user is not None:
+            return user
+    
+        user_doc = await db.users.find_one(users_storage.translate({"id": user_id}), users_storage.translate({"_id": 0, "password": 0}))
         if user_doc is None:
             raise HTTPException(status_code=401, detail="User not found")
-        
-        if isinstance(user_doc.get('created_at'), str):
-            user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-        
-        return User(**user_doc)
+    
+        user = User(**users_storage.from_doc(user_doc))
+        user_cache.set(user_id, user)
+        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
 @api_router.post("/auth/register", response_model=Token, status_code=status.HTTP_201_CREATED)
-async def register(user_create: UserCreate):
-    existing_user = await db.users.find_one({"email": user_create.email}, {"_id": 0})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
+async def register(user_create: UserCreate, request: Request):
+    await enforce_rate_limits(request, "register", user_create.email)
     user = User(email=user_create.email, name=user_create.name)
     user_dict = user.model_dump()
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
-    user_dict['password'] = hash_password(user_create.password)
+    user_dict['password'] = await hash_password_async(user_create.password)
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(users_storage.to_doc(user_dict))
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    user_cache.invalidate(user.id)
     
-    access_token = create_access_token(data={"sub": user.id})
-    return Token(access_token=access_token, token_type="bearer", user=user)
+    return await issue_tokens(user)
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(user_login: UserLogin):
-    user_doc = await db.users.find_one({"email": user_login.email}, {"_id": 0})
+async def login(user_login: UserLogin, request: Request):
+    await enforce_rate_limits(request, "login", user_login.email)
+    user_doc = await db.users.find_one(users_storage.translate({"email": user_login.email}), {"_id": 0})
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if not verify_password(user_login.password, user_doc['password']):
+    user_doc = users_storage.from_doc(user_doc)
+    if not await verify_password_async(user_login.password, user_doc.pop('password')):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if isinstance(user_doc.get('created_at'), str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-    
-    user_doc.pop('password', None)
     user = User(**user_doc)
     
-    access_token = create_access_token(data={"sub": user.id})
-    return Token(access_token=access_token, token_type="bearer", user=user)
+    return await issue_tokens(user)
+
+@api_router.post("/auth/refresh", response_model=Token)
+async def refresh_tokens(refresh_request: RefreshRequest):
+    try:
+        payload = jwt.decode(refresh_request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token has expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    if payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    
+    token_doc = await db.refresh_tokens.find_one_and_update(
+        {"jti": payload['jti'], "used": False},
+        {"$set": {"used": True}},
+        projection={"_id": 0}
+    )
+    if token_doc is None:
+        reused = await db.refresh_tokens.find_one({"jti": payload['jti']}, {"_id": 0, "family": 1})
+        if reused:
+            await db.refresh_tokens.update_many({"family": reused['family']}, {"$set": {"used": True}})
+            logger.warning("Refresh token reuse detected for user %s; revoked token family", payload['sub'])
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked")
+    
+    user_doc = await db.users.find_one(
+        users_storage.translate({"id": token_doc['user_id']}), users_storage.translate({"_id": 0, "password": 0})
+    )
+    if user_doc is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    return await issue_tokens(User(**users_storage.from_doc(user_doc)), token_doc['family'])
+
+@api_router.post("/auth/logout")
+async def logout(
+    logout_request: LogoutRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user)
+):
+    payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+    if payload.get('jti'):
+        await revoke_access_token(payload['jti'], datetime.fromtimestamp(payload['exp'], timezone.utc))
+    
+    if logout_request.refresh_token:
+        try:
+            refresh_payload = jwt.decode(logout_request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.InvalidTokenError:
+            refresh_payload = {}
+        if refresh_payload.get('sub') == current_user.id:
+            await db.refresh_tokens.update_one({"jti": refresh_payload.get('jti')}, {"$set": {"used": True}})
+    
+    return {"message": "Logged out successfully"}
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@api_router.patch("/users/{user_id}/role", response_model=User)
+async def update_user_role(user_id: str, role_update: RoleUpdate, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    user_doc = await db.users.find_one_and_update(
+        users_storage.translate({"id": user_id}),
+        users_storage.translate({"$set": {"role": role_update.role}}),
+        projection=users_storage.translate({"_id": 0, "password": 0}),
+        return_document=ReturnDocument.AFTER
+    )
+    if user_doc is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    user_cache.invalidate(user_id)
+    await invalidation_bus.publish("users", key=user_id)
+    await revoke_user_tokens(user_id)
+    
+    return User(**users_storage.from_doc(user_doc))
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return {"user_cache": user_cache.stats()}
+
 @api_router.get("/services", response_model=List[Service])
-async def get_services():
-    services = await db.services.find({}, {"_id": 0}).to_list(100)
-    if not services:
-        default_services = [
-            {
-                "id": "service-1",
-                "name": "Basic House Cleaning",
-                "description": "Standard cleaning of all rooms including dusting, vacuuming, mopping, and bathroom cleaning.",
-                "duration_minutes": 120,
-                "price": 89.99,
-                "image_url": "https://images.unsplash.com/photo-1597665863042-47e00964d899"
-            },
-            {
-                "id": "service-2",
-                "name": "Deep Cleaning",
-                "description": "Thorough cleaning including baseboards, inside appliances, windows, and hard-to-reach areas.",
-                "duration_minutes": 240,
-                "price": 179.99,
-                "image_url": "https://images.unsplash.com/photo-1759301495175-51e540735644"
-            },
-            {
-                "id": "service-3",
-                "name": "Office Cleaning",
-                "description": "Professional cleaning for office spaces including desks, common areas, restrooms, and kitchenettes.",
-                "duration_minutes": 180,
-                "price": 149.99,
-                "image_url": "https://images.unsplash.com/photo-1504297050568-910d24c426d3"
-            }
-        ]
-        await db.services.insert_many(default_services)
-        services = default_services
-    return services
+async def get_services(request: Request):
+    headers = {"ETag": service_catalog.etag, "Cache-Control": SERVICES_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), service_catalog.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=service_catalog.body, media_type="application/json", headers=headers)
 
-@api_router.post("/bookings", response_model=Booking, status_code=status.HTTP_201_CREATED)
-async def create_booking(booking_create: BookingCreate, current_user: User = Depends(get_current_user)):
+async def insert_booking(booking_create: BookingCreate, current_user: User) -> Booking:
+    service = service_catalog.by_id.get(booking_create.service_id)
+    if service is None:
+        raise HTTPException(status_code=400, detail="Unknown service")
+    
+    parse_booking_date(booking_create.booking_date)
+    slots = booking_slots(booking_create.booking_time, service['duration_minutes'])
+    # A remote geocoder is never awaited here: unless the address is cached, the backfill job locates it
+    try:
+        location = await geocode_address(booking_create.address, cached_only=geocoder.remote)
+        geo_pending = location is None and geocoder.remote
+    except Exception:
+        logger.warning("Geocoding failed, leaving the booking to the location backfill", exc_info=True)
+        location, geo_pending = None, True
+    if not await reserve_slots(booking_create.booking_date, slots):
+        raise HTTPException(status_code=409, detail="Selected time slot is fully booked")
+    
     booking = Booking(
         user_id=current_user.id,
         user_email=current_user.email,
         user_name=current_user.name,
         service_id=booking_create.service_id,
-        service_name=booking_create.service_name,
+        service_name=service['name'],
         booking_date=booking_create.booking_date,
         booking_time=booking_create.booking_time,
         address=booking_create.address,
         phone=booking_create.phone,
-        notes=booking_create.notes
+        notes=booking_create.notes,
+        location=location
     )
     
-    booking_dict = booking.model_dump()
-    booking_dict['created_at'] = booking_dict['created_at'].isoformat()
+    booking_dict = booking.model_dump(exclude=BOOKING_DERIVED_FIELDS)
+    booking_dict['slots'] = slots
+    if geo_pending:
+        booking_dict['geo_pending'] = booking.created_at
     
-    await db.bookings.insert_one(booking_dict)
+    try:
+        await db.bookings.insert_one(bookings_storage.to_doc(booking_dict))
+    except Exception:
+        await release_slots(booking_create.booking_date, slots)
+        raise
+    await update_rollups([(booking_dict, None, booking_dict['status'])])
+    await publish_booking_events([("created", booking.model_dump(mode="json"))])
+    jobs = [("booking_confirmation", {"booking_id": booking.id})]
+    if geo_pending:
+        jobs.append(("backfill_locations", {"booking_id": booking.id}))
+    for job_type, payload in jobs:
+        try:
+            await enqueue_job(job_type, payload, key=booking.id)
+        except Exception:
+            logger.exception("Failed to enqueue %s for booking %s", job_type, booking.id)
     return booking
 
+def idempotent_replay(doc: dict, request_hash: str) -> JSONResponse:
+    if doc['request_hash'] != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if doc['status'] != "completed":
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    return JSONResponse(status_code=doc['status_code'], content=doc['response'], headers={"Idempotent-Replayed": "true"})
+
+@api_router.post("/bookings", response_model=Booking, status_code=status.HTTP_201_CREATED)
+async def create_booking(
+    booking_create: BookingCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: User = Depends(get_current_user)
+):
+    if not idempotency_key:
+        return await insert_booking(booking_create, current_user)
+    
+    key = f"{current_user.id}:{idempotency_key}"
+    request_hash = hashlib.sha256(booking_create.model_dump_json().encode()).hexdigest()
+    cached = idempotency_cache.get(key)
+    if cached is not None:
+        return idempotent_replay(cached, request_hash)
+    
+    now = datetime.now(timezone.utc)
+    lease = uuid.uuid4().hex
+    try:
+        await db.idempotency_keys.insert_one({
+            "_id": key,
+            "request_hash": request_hash,
+            "status": "in_progress",
+            "lease": lease,
+            "locked_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+            "created_at": now
+        })
+    except DuplicateKeyError:
+        doc = await db.idempotency_keys.find_one({"_id": key})
+        if doc is None:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        if doc['status'] == "completed":
+            idempotency_cache.set(key, doc)
+        # A claim whose lease lapsed belongs to a request that died before finishing; take it over
+        locked_until = doc.get('locked_until', doc['created_at'] + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS))
+        stale = doc['status'] == "in_progress" and doc['request_hash'] == request_hash and locked_until < now
+        if not stale or not await db.idempotency_keys.find_one_and_update(
+            {"_id": key, "status": "in_progress", "lease": doc.get('lease')},
+            {"$set": {"lease": lease, "locked_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}}
+        ):
+            return idempotent_replay(doc, request_hash)
+    
+    try:
+        booking = await insert_booking(booking_create, current_user)
+    except Exception:
+        await db.idempotency_keys.delete_one({"_id": key, "lease": lease})
+        raise
+    
+    doc = {
+        "_id": key,
+        "request_hash": request_hash,
+        "status": "completed",
+        "status_code": status.HTTP_201_CREATED,
+        "response": booking.model_dump(mode="json")
+    }
+    await db.idempotency_keys.update_one({"_id": key, "lease": lease}, {"$set": doc, "$unset": {"lease": "", "locked_until": ""}})
+    idempotency_cache.set(key, doc)
+    return booking
+
+@api_router.get("/availability", response_model=List[DayAvailability])
+async def get_availability(date_from: str, date_to: str, service_id: Optional[str] = None):
+    start = parse_booking_date(date_from)
+    end = parse_booking_date(date_to)
+    if end < start or (end - start).days >= AVAILABILITY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must span 1 to {AVAILABILITY_MAX_DAYS} days")
+    
+    span = 1
+    if service_id:
+        service = service_catalog.by_id.get(service_id)
+        if service is None:
+            raise HTTPException(status_code=400, detail="Unknown service")
+        span = math.ceil(service["duration_minutes"] / SLOT_MINUTES)
+    
+    occupancy = {
+        doc['_id']: doc.get('slots', {})
+        for doc in await db.slot_occupancy.find({"_id": {"$gte": date_from, "$lte": date_to}}).to_list(None)
+    }
+    
+    slots = business_slots()
+    days = []
+    for offset in range((end - start).days + 1):
+        day = (start + timedelta(days=offset)).isoformat()
+        taken = occupancy.get(day, {})
+        remaining = [max(SLOT_CAPACITY - taken.get(slot, 0), 0) for slot in slots]
+        day_slots = [
+            SlotAvailability(time=slots[i], remaining=min(remaining[i:i + span]))
+            for i in range(len(slots) - span + 1)
+        ]
+        days.append(DayAvailability(date=day, slots=[slot for slot in day_slots if slot.remaining > 0]))
+    return days
+
 @api_router.get("/bookings/user", response_model=List[Booking])
-async def get_user_bookings(current_user: User = Depends(get_current_user)):
-    bookings = await db.bookings.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
+async def get_user_bookings(
+    limit: int = Query(BOOKINGS_MAX_PAGE_SIZE, ge=1, le=BOOKINGS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    query = build_bookings_query(cursor=cursor)
+    query['user_id'] = current_user.id
+    collections = [db.bookings, db.bookings_archive] if include_archived else [db.bookings]
     
-    for booking in bookings:
-        if isinstance(booking.get('created_at'), str):
-            booking['created_at'] = datetime.fromisoformat(booking['created_at'])
+    bookings = []
+    for collection in collections:
+        bookings.extend(await find_bookings_page(collection, query, limit + 1))
+    if include_archived:
+        bookings = sorted(bookings, key=booking_sort_key, reverse=True)[:limit + 1]
     
-    return bookings
+    headers = {}
+    if len(bookings) > limit:
+        bookings = bookings[:limit]
+        headers["X-Next-Cursor"] = encode_bookings_cursor(bookings[-1])
+    
+    return ORJSONResponse(await hydrate_bookings(bookings), headers=headers)
 
 @api_router.get("/bookings/all", response_model=List[Booking])
-async def get_all_bookings(current_user: User = Depends(get_current_user)):
+async def get_all_bookings(
+    limit: int = Query(BOOKINGS_PAGE_SIZE, ge=1, le=BOOKINGS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[BookingStatus] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    service_id: Optional[str] = None,
+    stream: bool = False,
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
+
+    query = build_bookings_query(status.value if status else None, date_from, date_to, service_id, cursor)
+
+    if stream:
+        return StreamingResponse(stream_bookings(find_bookings_sorted(query, include_archived)), media_type="application/x-ndjson")
+
+    collections = [db.bookings, db.bookings_archive] if include_archived else [db.bookings]
+
+    bookings = []
+    for collection in collections:
+        bookings.extend(await find_bookings_page(collection, query, limit + 1))
+    if include_archived:
+        bookings = sorted(bookings, key=booking_sort_key, reverse=True)[:limit + 1]
+
+    headers = {}
+    if len(bookings) > limit:
+        bookings = bookings[:limit]
+        headers["X-Next-Cursor"] = encode_bookings_cursor(bookings[-1])
+
+    return ORJSONResponse(await hydrate_bookings(bookings), headers=headers)
+
+@api_router.get("/bookings/search", response_model=List[Booking])
+async def search_bookings(
+    q: Optional[str] = Query(None, min_length=1, max_length=200),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=SEARCH_MAX_RADIUS_KM),
+    booking_date: Optional[str] = Query(None, alias="date"),
+    status: Optional[BookingStatus] = None,
+    service_id: Optional[str] = None,
+    limit: int = Query(BOOKINGS_PAGE_SIZE, ge=1, le=BOOKINGS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if (lat is None) != (lng is None):
+        raise HTTPException(status_code=400, detail="lat and lng must be given together")
+    if q is None and lat is None:
+        raise HTTPException(status_code=400, detail="Provide a keyword or a location to search")
+    if booking_date:
+        parse_booking_date(booking_date)
     
-    bookings = await db.bookings.find({}, {"_id": 0}).to_list(1000)
+    query = build_bookings_query(status.value if status else None, booking_date, booking_date, service_id, cursor)
+    if lat is not None:
+        query['location'] = {"$geoWithin": {"$centerSphere": [[lng, lat], radius_km / EARTH_RADIUS_KM]}}
+    if q:
+        user_docs = await db.users.find(
+            {"$text": {"$search": q}}, users_storage.translate({"_id": 0, "id": 1})
+        ).limit(SEARCH_MAX_USER_MATCHES).to_list(None)
+        user_ids = [users_storage.from_doc(user_doc)['id'] for user_doc in user_docs]
+        if not user_ids:
+            query['$text'] = {"$search": q}
+        else:
+            # Names live on users, so a keyword also matches bookings of users whose name matches
+            keyword = {"$or": [{"$text": {"$search": q}}, {"user_id": {"$in": user_ids}}]}
+            if '$or' in query:
+                query['$and'] = [{"$or": query.pop('$or')}, keyword]
+            else:
+                query.update(keyword)
     
-    for booking in bookings:
-        if isinstance(booking.get('created_at'), str):
-            booking['created_at'] = datetime.fromisoformat(booking['created_at'])
+    bookings = await find_bookings_page(db.bookings, query, limit + 1)
     
-    return bookings
+    headers = {}
+    if len(bookings) > limit:
+        bookings = bookings[:limit]
+        headers["X-Next-Cursor"] = encode_bookings_cursor(bookings[-1])
+    
+    return ORJSONResponse(await hydrate_bookings(bookings), headers=headers)
 
-@api_router.patch("/bookings/{booking_id}/status")
-async def update_booking_status(booking_id: str, status: str, current_user: User = Depends(get_current_user)):
+@api_router.get("/admin/bookings/export")
+async def export_bookings(
+    export_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    status: Optional[BookingStatus] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    service_id: Optional[str] = None,
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    result = await db.bookings.update_one(
-        {"id": booking_id},
-        {"$set": {"status": status}}
+    db_cursor = find_bookings_sorted(build_bookings_query(status.value if status else None, date_from, date_to, service_id), include_archived)
+    filename = f"bookings-{datetime.now(timezone.utc):%Y%m%d}.{export_format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if export_format == "csv":
+        header_row = encode_csv_rows([BOOKING_EXPORT_COLUMNS + ["longitude", "latitude"]])
+        return StreamingResponse(stream_bookings(db_cursor, encode_bookings_csv, header_row), media_type="text/csv", headers=headers)
+    return StreamingResponse(stream_bookings(db_cursor), media_type="application/x-ndjson", headers=headers)
+
+async def iter_request_lines(request: Request):
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.decode().rstrip("\r")
+    if buffer:
+        yield buffer.decode().rstrip("\r")
+
+async def read_import_rows(request: Request, import_format: str):
+    row_number = 0
+    if import_format == "ndjson":
+        async for line in iter_request_lines(request):
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                row = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                row = None
+            yield row_number, row if isinstance(row, dict) else None
+        return
+    
+    header = None
+    record = ""
+    async for line in iter_request_lines(request):
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            # Inside a quoted field that spans lines
+            continue
+        if not record.strip():
+            record = ""
+            continue
+        values = next(csv.reader([record]))
+        record = ""
+        if header is None:
+            header = [column.strip().lstrip("\ufeff") for column in values]
+            continue
+        row_number += 1
+        yield row_number, {column: value for column, value in zip(header, values) if value != ""}
+
+def import_error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        first = error.errors()[0]
+        return f"{'.'.join(str(part) for part in first['loc'])}: {first['msg']}"
+    if isinstance(error, HTTPException):
+        return error.detail
+    return str(error)
+
+async def import_bookings_batch(rows: List[Tuple[int, Optional[dict]]]) -> Tuple[int, List[BookingImportError]]:
+    errors = []
+    emails = [row['user_email'] for _, row in rows if row and isinstance(row.get('user_email'), str)]
+    user_ids = [row['user_id'] for _, row in rows if row and isinstance(row.get('user_id'), str)]
+    users = [users_storage.from_doc(user_doc) for user_doc in await db.users.find(
+        users_storage.translate({"$or": [{"email": {"$in": emails}}, {"id": {"$in": user_ids}}]}),
+        users_storage.translate({"_id": 0, "id": 1, "email": 1})
+    ).to_list(None)]
+    ids_by_email = {user['email']: user['id'] for user in users}
+    known_ids = {user['id'] for user in users}
+    
+    docs = []
+    row_numbers = []
+    for row_number, row in rows:
+        try:
+            if row is None:
+                raise ValueError("Row is not a valid JSON object")
+            # NDJSON values can be any JSON type; these are used before model validation
+            for field in IMPORT_STRING_FIELDS:
+                if not isinstance(row.get(field, ""), str):
+                    raise ValueError(f"{field}: must be a string")
+            booking_create = BookingCreate.model_validate(row)
+            service = service_catalog.by_id.get(booking_create.service_id)
+            if service is None:
+                raise ValueError("Unknown service")
+            parse_booking_date(booking_create.booking_date)
+            user_id = row.get('user_id') or ids_by_email.get(row.get('user_email'))
+            if user_id not in known_ids:
+                raise ValueError("Unknown user")
+            created_at = datetime.fromisoformat(row['created_at']) if row.get('created_at') else datetime.now(timezone.utc)
+            booking = Booking(
+                user_id=user_id,
+                user_email="",
+                user_name="",
+                service_name="",
+                status=row.get('status', BookingStatus.pending),
+                created_at=created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc),
+                **({"id": row['id']} if row.get('id') else {}),
+                **booking_create.model_dump(exclude={"service_name"})
+            )
+            doc = booking.model_dump(exclude=BOOKING_DERIVED_FIELDS | {"location"})
+            doc['slots'] = booking_slots(booking_create.booking_time, service['duration_minutes'])
+            doc['geo_pending'] = created_at
+        except (ValidationError, HTTPException, ValueError, TypeError) as e:
+            errors.append(BookingImportError(row=row_number, error=import_error_message(e)))
+            continue
+        docs.append(doc)
+        row_numbers.append(row_number)
+    
+    # Upcoming bookings are admitted against capacity like POST /bookings; past ones are history and only counted
+    today = datetime.now(timezone.utc).date().isoformat()
+    admitted = []
+    reserved = set()
+    for doc, row_number in zip(docs, row_numbers):
+        if doc['status'] != "cancelled" and doc['booking_date'] >= today:
+            if not await reserve_slots(doc['booking_date'], doc['slots']):
+                errors.append(BookingImportError(row=row_number, error="Selected time slot is fully booked"))
+                continue
+            reserved.add(doc['id'])
+        admitted.append((doc, row_number))
+    docs = [doc for doc, _ in admitted]
+    row_numbers = [row_number for _, row_number in admitted]
+    
+    failed = set()
+    if docs:
+        try:
+            await db.bookings.insert_many([bookings_storage.to_doc(doc) for doc in docs], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                failed.add(error['index'])
+                message = "Duplicate booking id" if error['code'] == 11000 else error.get('errmsg', "Write failed")
+                errors.append(BookingImportError(row=row_numbers[error['index']], error=message))
+    
+    inserted = [doc for index, doc in enumerate(docs) if index not in failed]
+    await release_slots_bulk([doc for index, doc in enumerate(docs) if index in failed and doc['id'] in reserved])
+    await adjust_slots_bulk([doc for doc in inserted if doc['status'] != "cancelled" and doc['id'] not in reserved], 1)
+    await update_rollups([(doc, None, doc['status']) for doc in inserted])
+    return len(inserted), sorted(errors, key=lambda error: error.row)
+
+@api_router.post("/admin/bookings/import", response_model=BookingImportResult)
+async def import_bookings(
+    request: Request,
+    import_format: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    if import_format is None:
+        content_type = request.headers.get("content-type", "")
+        import_format = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+    
+    received = 0
+    inserted = 0
+    errors = []
+    failed = 0
+    batch = []
+    try:
+        async for row in read_import_rows(request, import_format):
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                batch_inserted, batch_errors = await import_bookings_batch(batch)
+                received, inserted, failed = received + len(batch), inserted + batch_inserted, failed + len(batch_errors)
+                errors.extend(batch_errors[:IMPORT_MAX_ERRORS - len(errors)])
+                batch = []
+        if batch:
+            batch_inserted, batch_errors = await import_bookings_batch(batch)
+            received, inserted, failed = received + len(batch), inserted + batch_inserted, failed + len(batch_errors)
+            errors.extend(batch_errors[:IMPORT_MAX_ERRORS - len(errors)])
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail=f"Import must be UTF-8; stopped after {received} rows ({inserted} inserted)")
+    
+    if inserted:
+        await publish_booking_events([("reset", {})])
+        try:
+            await enqueue_job("backfill_locations", {})
+        except Exception:
+            logger.exception("Failed to enqueue the location backfill")
+    return BookingImportResult(
+        received=received,
+        inserted=inserted,
+        failed=failed,
+        errors=errors,
+        errors_truncated=failed > len(errors)
     )
+
+@api_router.patch("/bookings/status", response_model=BulkStatusResult)
+async def bulk_update_booking_status(bulk_update: BulkStatusUpdate, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    if result.matched_count == 0:
+    if bulk_update.filter is None:
+        results = await apply_status_updates([(u.booking_id, u.status.value) for u in bulk_update.updates])
+        return BulkStatusResult(updated=sum(r.result == "updated" for r in results), results=results)
+    
+    if bulk_update.updates or bulk_update.status is None:
+        raise HTTPException(status_code=400, detail="Provide either updates, or a filter together with a status")
+    
+    criteria = bulk_update.filter
+    query = build_bookings_query(
+        criteria.status.value if criteria.status else None,
+        criteria.date_from,
+        criteria.date_to,
+        criteria.service_id
+    )
+    if criteria.status is None:
+        query['status'] = {"$ne": bulk_update.status.value}
+    
+    results = []
+    last_id = None
+    while True:
+        batch_query = dict(query, id={"$gt": last_id}) if last_id else query
+        docs = await db.bookings.find(
+            bookings_storage.translate(batch_query), bookings_storage.translate({"_id": 0, "id": 1})
+        ).sort(bookings_storage.field("id"), 1).limit(BULK_STATUS_BATCH_SIZE).to_list(None)
+        ids = [bookings_storage.from_doc(doc)['id'] for doc in docs]
+        if not ids:
+            break
+        results.extend(await apply_status_updates([(booking_id, bulk_update.status.value) for booking_id in ids]))
+        last_id = ids[-1]
+    
+    return BulkStatusResult(updated=sum(r.result == "updated" for r in results), results=results)
+
+@api_router.patch("/bookings/{booking_id}/status")
+async def update_booking_status(booking_id: str, status: BookingStatus, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    booking = await db.bookings.find_one(bookings_storage.translate({"id": booking_id}), {"_id": 0})
+    if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
+    booking = bookings_storage.from_doc(booking)
+    if not await transition_booking_status(booking, status.value):
+        raise HTTPException(status_code=409, detail="Booking was modified concurrently")
+    
     return {"message": "Status updated successfully"}
 
 @api_router.delete("/bookings/{booking_id}")
 async def cancel_booking(booking_id: str, current_user: User = Depends(get_current_user)):
-    booking = await db.bookings.find_one({"id": booking_id}, {"_id": 0})
+    booking = await db.bookings.find_one(bookings_storage.translate({"id": booking_id}), {"_id": 0})
     
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
+    booking = bookings_storage.from_doc(booking)
     if booking['user_id'] != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.bookings.delete_one({"id": booking_id})
+    if booking['status'] == "completed":
+        raise HTTPException(status_code=400, detail="Completed bookings cannot be cancelled")
+    
+    if booking['status'] != "cancelled" and not await transition_booking_status(booking, "cancelled"):
+        raise HTTPException(status_code=409, detail="Booking was modified concurrently")
     return {"message": "Booking cancelled successfully"}
 
+@api_router.get("/admin/bookings/events")
+async def stream_booking_events(
+    token: str,
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    # EventSource cannot send an Authorization header, so the access token travels in the query string
+    current_user = await authenticate_token(token)
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    return StreamingResponse(
+        booking_events.stream(last_event_id_header or last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def archive_bookings() -> int:
+    cutoff = (datetime.now(timezone.utc).date() - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+    query = {"status": {"$in": ARCHIVED_STATUSES}, "booking_date": {"$lt": cutoff}}
+    archived = 0
+    rejected = []
+    while True:
+        if rejected:
+            query['id'] = {"$nin": rejected}
+        docs = await db.bookings.find(bookings_storage.translate(query), {"_id": 0}).limit(ARCHIVE_BATCH_SIZE).to_list(None)
+        if not docs:
+            break
+        ids = [bookings_storage.from_doc(doc)['id'] for doc in docs]
+        try:
+            await db.bookings_archive.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Duplicates are copies left by an earlier interrupted run; anything else stays hot and is skipped
+            for error in e.details.get('writeErrors', []):
+                if error['code'] != 11000:
+                    rejected.append(ids[error['index']])
+                    logger.error("Archive rejected booking %s: %s", ids[error['index']], error.get('errmsg'))
+            ids = [booking_id for booking_id in ids if booking_id not in rejected]
+        result = await db.bookings.delete_many(bookings_storage.translate({"id": {"$in": ids}, "status": {"$in": ARCHIVED_STATUSES}}))
+        archived += result.deleted_count
+        reopened = []
+        if result.deleted_count < len(ids):
+            # Reopened between the read and the delete: the hot copy stays authoritative
+            reopened = await db.bookings.distinct(bookings_storage.field("id"), bookings_storage.translate({"id": {"$in": ids}}))
+            await db.bookings_archive.delete_many(bookings_storage.translate({"id": {"$in": reopened}}))
+        await publish_booking_events([("archived", {"id": booking_id}) for booking_id in ids if booking_id not in reopened])
+        if len(docs) < ARCHIVE_BATCH_SIZE:
+            break
+    if archived:
+        logger.info("Archived %d bookings older than %s", archived, cutoff)
+    return archived
+
+async def run_archiver():
+    while True:
+        try:
+            await archive_bookings()
+        except Exception:
+            logger.exception("Failed to archive bookings")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
+
+class FakeNotificationTransport:
+    def __init__(self, failure_rate: float = 0.0):
+        self.failure_rate = failure_rate
+        self.sent = deque(maxlen=1000)
+
+    async def send(self, recipient: str, subject: str, body: str):
+        if random.random() < self.failure_rate:
+            raise ConnectionError("Fake transport failure")
+        self.sent.append({"recipient": recipient, "subject": subject, "body": body, "sent_at": datetime.now(timezone.utc)})
+        logger.info("Fake notification to %s: %s", recipient, subject)
+
+NOTIFICATION_TRANSPORTS = {
+    "fake": lambda: FakeNotificationTransport(NOTIFICATION_FAKE_FAILURE_RATE),
+}
+notification_transport = NOTIFICATION_TRANSPORTS[NOTIFICATION_TRANSPORT]()
+
+async def send_booking_confirmation(payload: dict):
+    booking = await db.bookings.find_one(
+        bookings_storage.translate({"id": payload['booking_id']}), bookings_storage.translate(BOOKING_PROJECTION)
+    )
+    if booking is None:
+        return
+    booking = (await hydrate_bookings([bookings_storage.from_doc(booking)]))[0]
+    if not booking['user_email']:
+        return
+    await notification_transport.send(
+        booking['user_email'],
+        f"Your {booking['service_name']} booking is received",
+        f"Hi {booking['user_name']}, we have your booking for {booking['booking_date']} at {booking['booking_time']} "
+        f"at {booking['address']}. We will let you know once it is confirmed."
+    )
+
+async def backfill_booking_locations(payload: dict):
+    # Each booking is claimed before geocoding, so concurrent runs never geocode the same row.
+    # A geocoder error fails the job: the claim lapses and the queue retries with backoff.
+    query = {"id": payload['booking_id']} if payload.get('booking_id') else {}
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS / 2
+    backfilled = 0
+    while time.monotonic() < deadline:
+        now = datetime.now(timezone.utc)
+        # BSON dates keep milliseconds, so truncate to match the stored claim exactly
+        claimed_until = now + timedelta(seconds=JOB_LEASE_SECONDS)
+        claimed_until = claimed_until.replace(microsecond=claimed_until.microsecond // 1000 * 1000)
+        claimed = await db.bookings.find_one_and_update(
+            bookings_storage.translate({**query, "geo_pending": {"$lte": now}}),
+            bookings_storage.translate({"$set": {"geo_pending": claimed_until}}),
+            projection=bookings_storage.translate({"_id": 0, "id": 1, "address": 1})
+        )
+        if claimed is None:
+            break
+        booking = bookings_storage.from_doc(claimed)
+        # Sequential on purpose: remote geocoders rate-limit per client
+        location = await geocode_address(booking['address'])
+        await db.bookings.update_one(
+            bookings_storage.translate({"id": booking['id'], "geo_pending": claimed_until}),
+            bookings_storage.translate({"$set": {"location": location}, "$unset": {"geo_pending": ""}})
+        )
+        backfilled += 1
+    else:
+        # Out of time for this run; a fresh job picks up the rest
+        await enqueue_job("backfill_locations", {})
+    if backfilled:
+        logger.info("Geocoded %d existing bookings", backfilled)
+
+JOB_HANDLERS = {
+    "booking_confirmation": send_booking_confirmation,
+    "backfill_locations": backfill_booking_locations,
+}
+
+job_worker = None
+
+async def enqueue_job(job_type: str, payload: dict, key: Optional[str] = None, delay_seconds: float = 0):
+    now = datetime.now(timezone.utc)
+    run_at = now + timedelta(seconds=delay_seconds)
+    try:
+        await db.jobs.insert_one({
+            "_id": f"{job_type}:{key}" if key else str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "run_at": run_at,
+            "available_at": run_at,
+            "created_at": now
+        })
+    except DuplicateKeyError:
+        return
+    metrics.observe_job_outcome(job_type, "enqueued")
+    if job_worker is not None and not delay_seconds:
+        job_worker.wake()
+
+def job_backoff_seconds(attempts: int) -> float:
+    delay = min(JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+class JobWorker:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.worker_id = invalidation_bus.worker_id
+        self.stopping = False
+        self.task = None
+        self._wakeup = None
+
+    def wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def start(self) -> asyncio.Task:
+        self._wakeup = asyncio.get_running_loop().create_future()
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def run(self):
+        await asyncio.gather(*(self._loop() for _ in range(self.concurrency)))
+
+    async def stop(self):
+        # Let in-flight jobs finish; anything still running afterwards is retried once its lease lapses
+        self.stopping = True
+        self.wake()
+        if self.task is not None:
+            await asyncio.wait([self.task], timeout=JOB_TIMEOUT_SECONDS)
+
+    async def _loop(self):
+        while not self.stopping:
+            # Re-arm before claiming so a wake-up that lands while we query is not lost
+            if self._wakeup.done():
+                self._wakeup = asyncio.get_running_loop().create_future()
+            wakeup = self._wakeup
+            try:
+                job = await self.claim()
+            except Exception:
+                logger.exception("Failed to claim a job")
+                job = None
+            if job is None:
+                await asyncio.wait([wakeup], timeout=JOB_POLL_SECONDS)
+                continue
+            await self.execute(job)
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        # Queued jobs that are due and running jobs whose lease lapsed are both claimable
+        return await db.jobs.find_one_and_update(
+            {"available_at": {"$lte": now}},
+            {
+                "$set": {
+                    "status": "running",
+                    "available_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "lease_id": uuid.uuid4().hex,
+                    "worker": self.worker_id,
+                    "started_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def execute(self, job: dict):
+        lease = {"_id": job['_id'], "lease_id": job['lease_id']}
+        handler = JOB_HANDLERS.get(job['type'])
+        start = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job type {job['type']}")
+            await asyncio.wait_for(handler(job['payload']), JOB_TIMEOUT_SECONDS)
+        except Exception as e:
+            metrics.observe_job_run(job['type'], time.perf_counter() - start, (job['started_at'] - job['run_at']).total_seconds())
+            await self.fail(job, lease, f"{type(e).__name__}: {e}")
+            return
+        metrics.observe_job_run(job['type'], time.perf_counter() - start, (job['started_at'] - job['run_at']).total_seconds())
+        await db.jobs.delete_one(lease)
+        metrics.observe_job_outcome(job['type'], "completed")
+
+    async def fail(self, job: dict, lease: dict, error: str):
+        now = datetime.now(timezone.utc)
+        if job['attempts'] >= job.get('max_attempts', JOB_MAX_ATTEMPTS):
+            dead = {key: value for key, value in job.items() if key not in ("lease_id", "available_at")}
+            await db.jobs_dead.replace_one(
+                {"_id": job['_id']}, {**dead, "status": "dead", "last_error": error, "failed_at": now}, upsert=True
+            )
+            await db.jobs.delete_one(lease)
+            metrics.observe_job_outcome(job['type'], "dead")
+            logger.error("Job %s moved to the dead-letter queue after %d attempts: %s", job['_id'], job['attempts'], error)
+            return
+        run_at = now + timedelta(seconds=job_backoff_seconds(job['attempts']))
+        await db.jobs.update_one(
+            lease,
+            {"$set": {"status": "queued", "run_at": run_at, "available_at": run_at, "last_error": error}, "$unset": {"lease_id": ""}}
+        )
+        metrics.observe_job_outcome(job['type'], "retried")
+        logger.warning("Job %s failed on attempt %d, retrying: %s", job['_id'], job['attempts'], error)
+
+async def ensure_indexes():
+    for collection, indexes in INDEXES.items():
+        schema = STORAGE_SCHEMAS.get(collection)
+        for keys, options in indexes:
+            await db[collection].create_index(schema.sort(keys) if schema else keys, **options)
+    for collection, indexes in SUPERSEDED_INDEXES.items():
+        schema = STORAGE_SCHEMAS.get(collection)
+        existing = [info['key'] for info in (await db[collection].index_information()).values()]
+        for keys in indexes:
+            keys = schema.sort(keys) if schema else keys
+            if keys not in existing:
+                continue
+            try:
+                await db[collection].drop_index(keys)
+            except OperationFailure as e:
+                # IndexNotFound: another worker dropped it first
+                if e.code != 27:
+                    raise
+            logger.info("Dropped superseded index %s on %s", keys, collection)
+
+def plan_stages(plan: dict):
+    if not isinstance(plan, dict):
+        return
+    if 'stage' in plan:
+        yield plan['stage']
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from plan_stages(child)
+
+async def verify_query_plans():
+    failures = []
+    for collection, query, sort in QUERY_SHAPES:
+        schema = STORAGE_SCHEMAS.get(collection)
+        if schema:
+            query, sort = schema.translate(query), sort and schema.sort(sort)
+        cursor = db[collection].find(query, {"_id": 0})
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+        stages = set(plan_stages(winning_plan))
+        # A blocking SORT means the index does not cover the requested order
+        if 'COLLSCAN' in stages or (sort and 'SORT' in stages):
+            failures.append(f"{collection} {query} sort={sort}")
+    
+    if failures:
+        raise RuntimeError("Query shapes fall back to COLLSCAN or an in-memory SORT: " + "; ".join(failures))
+    logger.info("Verified %d query shapes use indexes", len(QUERY_SHAPES))
+
+async def seed_services():
+    try:
+        result = await db.services.bulk_write(
+            [UpdateOne({"id": service["id"]}, {"$setOnInsert": service}, upsert=True) for service in DEFAULT_SERVICES],
+            ordered=False
+        )
+        upserted = result.upserted_count
+    except BulkWriteError as e:
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+            raise
+        upserted = e.details.get('nUpserted', 0)
+    if upserted:
+        await invalidation_bus.publish("services")
+
+async def drop_stale_indexes(collection: str, schema: StorageSchema):
+    # Indexes on the old field names would index every upgraded document under null
+    for name, info in (await db[collection].index_information()).items():
+        fields = [key for key, _ in info['key'] if key not in ("_id", "_fts", "_ftsx")] + list(info.get('weights', {}))
+        if any(field.split(".")[0] not in schema.long for field in fields):
+            try:
+                await db[collection].drop_index(name)
+            except OperationFailure as e:
+                # IndexNotFound: already dropped by a worker whose migration lock lapsed
+                if e.code != 27:
+                    raise
+                continue
+            logger.info("Dropped index %s on %s", name, collection)
+
+async def upgrade_documents(collection: str, schema: StorageSchema) -> int:
+    upgraded = 0
+    last_id = None
+    while True:
+        query = {"v": {"$ne": schema.version}}
+        if last_id is not None:
+            query['_id'] = {"$gt": last_id}
+        docs = await db[collection].find(query).sort("_id", 1).limit(MIGRATION_BATCH_SIZE).to_list(None)
+        if not docs:
+            break
+        # Guarded on the version so workers migrating side by side never apply a batch twice
+        result = await db[collection].bulk_write([
+            ReplaceOne({"_id": doc['_id'], "v": {"$ne": schema.version}}, schema.upgrade(doc))
+            for doc in docs
+        ], ordered=False)
+        upgraded += result.modified_count
+        last_id = docs[-1]['_id']
+    return upgraded
+
+async def backfill_slot_occupancy():
+    # Bookings from before slot tracking never reserved capacity; count the upcoming ones once so admission sees them
+    durations = {service['id']: service['duration_minutes'] for service in DEFAULT_SERVICES}
+    for service in await db.services.find({}, {"_id": 0, "id": 1, "duration_minutes": 1}).to_list(None):
+        durations[service['id']] = service['duration_minutes']
+    today = datetime.now(timezone.utc).date().isoformat()
+    query = bookings_storage.translate({"slots": {"$exists": False}, "status": {"$ne": "cancelled"}, "booking_date": {"$gte": today}})
+    projection = bookings_storage.translate({"id": 1, "service_id": 1, "booking_date": 1, "booking_time": 1})
+    counted = 0
+    last_id = None
+    while True:
+        page = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+        docs = await db.bookings.find(page, projection).sort("_id", 1).limit(MIGRATION_BATCH_SIZE).to_list(None)
+        if not docs:
+            break
+        last_id = docs[-1]['_id']
+        bookings = []
+        for booking in map(bookings_storage.from_doc, docs):
+            if booking.get('service_id') not in durations:
+                continue
+            try:
+                booking['slots'] = booking_slots(booking['booking_time'], durations[booking['service_id']])
+            except (HTTPException, KeyError, AttributeError):
+                continue
+            bookings.append(booking)
+        if not bookings:
+            continue
+        # Occupancy before slots: an interrupted run over-counts on retry rather than oversells
+        await adjust_slots_bulk(bookings, 1)
+        await db.bookings.bulk_write([
+            UpdateOne(
+                bookings_storage.translate({"id": booking['id'], "slots": {"$exists": False}}),
+                bookings_storage.translate({"$set": {"slots": booking['slots']}})
+            )
+            for booking in bookings
+        ], ordered=False)
+        counted += len(bookings)
+    if counted:
+        logger.info("Counted %d upcoming bookings into slot occupancy", counted)
+
+async def migrate_storage():
+    for collection, schema in STORAGE_SCHEMAS.items():
+        state = await db.storage_versions.find_one({"_id": collection})
+        if state and state['version'] >= schema.version:
+            continue
+        await drop_stale_indexes(collection, schema)
+        upgraded = await upgrade_documents(collection, schema)
+        if collection == "bookings":
+            await backfill_slot_occupancy()
+        await db.storage_versions.update_one(
+            {"_id": collection},
+            {"$set": {"version": schema.version, "migrated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        logger.info("Upgraded %d %s documents to storage version %d", upgraded, collection, schema.version)
+
+async def apply_storage_validators():
+    for collection, schema in STORAGE_SCHEMAS.items():
+        # Moderate: documents that predate the schema and still fail it are not blocked from updates
+        options = {"validator": schema.validator(), "validationLevel": "moderate"}
+        try:
+            await db.create_collection(collection, **options)
+        except CollectionInvalid:
+            await db.command("collMod", collection, **options)
+        except OperationFailure as e:
+            # NamespaceExists: created after pymongo's existence check
+            if e.code != 48:
+                raise
+            await db.command("collMod", collection, **options)
+
+async def load_service_catalog():
+    services = await db.services.find({}, {"_id": 0}).to_list(None)
+    service_catalog.load(services)
+    logger.info("Loaded service catalog version %d with %d services", service_catalog.version, len(services))
+
+async def outdated_storage_collections() -> List[str]:
+    versions = {doc['_id']: doc['version'] for doc in await db.storage_versions.find({}).to_list(None)}
+    return [collection for collection, schema in STORAGE_SCHEMAS.items() if versions.get(collection, 0) < schema.version]
+
+async def startup_storage():
+    # One process upgrades and applies validators; the others wait until the stored versions are current
+    while True:
+        async with mongo_lock("storage_migration") as acquired:
+            if acquired:
+                await migrate_storage()
+                if STORAGE_VALIDATION:
+                    await apply_storage_validators()
+                return
+        outdated = await outdated_storage_collections()
+        if not outdated:
+            return
+        logger.info("Waiting for another process to upgrade %s", ", ".join(outdated))
+        await asyncio.sleep(MIGRATION_WAIT_SECONDS)
+
+async def startup_indexes():
+    await ensure_indexes()
+    if INDEX_SELF_CHECK:
+        await verify_query_plans()
+
+async def startup_invalidation_bus():
+    if not INVALIDATION_BUS_ENABLED:
+        return
+    await invalidation_bus.start()
+    background_tasks.append(asyncio.create_task(invalidation_bus.tail()))
+    logger.info("Joined the invalidation bus as %s", invalidation_bus.worker_id)
+
+invalidation_bus.subscribe("users", lambda message: user_cache.invalidate(message['key']))
+invalidation_bus.subscribe("revocations", lambda message: revocation_list.apply(message['payload']))
+invalidation_bus.subscribe("services", lambda message: load_service_catalog())
+invalidation_bus.subscribe(
+    "booking_events",
+    lambda message: booking_events.publish(message['payload']['type'], message['payload']['booking'], event_id=message['key'])
+)
+
+async def startup_revocations():
+    await sync_revocations()
+    background_tasks.append(asyncio.create_task(poll_revocations()))
+
+async def startup_migrations():
+    # The keyed job runs on one worker; the rest only look the sparse geo_pending index up
+    if await db.bookings.find_one(bookings_storage.translate({"geo_pending": {"$exists": True}}), {"_id": 1}):
+        await enqueue_job("backfill_locations", {}, key="bookings")
+
+async def startup_service_catalog():
+    await seed_services()
+    await load_service_catalog()
+
+async def startup_analytics():
+    async with mongo_lock("rebuild_rollups") as acquired:
+        # Another worker holding the lock is already rebuilding
+        if acquired and not await db.booking_rollups.find_one({}) and await db.bookings.find_one({}):
+            await rebuild_rollups()
+
+async def startup_booking_events():
+    source = BOOKING_EVENTS_SOURCE
+    if source == "auto":
+        try:
+            hello = await client.admin.command("hello")
+            source = "change_stream" if hello.get("setName") or hello.get("msg") == "isdbgrid" else "local"
+        except Exception:
+            source = "local"
+    booking_events.source = source
+    if source == "change_stream":
+        background_tasks.append(asyncio.create_task(watch_booking_changes()))
+    logger.info("Publishing booking events from %s", source.replace("_", " "))
+
+async def startup_archiver():
+    if ARCHIVE_ENABLED:
+        background_tasks.append(asyncio.create_task(run_archiver()))
+
+@api_router.get("/admin/analytics", response_model=BookingAnalytics)
+async def get_booking_analytics(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    query = {}
+    if date_from or date_to:
+        query['_id'] = {}
+        if date_from:
+            query['_id']['$gte'] = date_from
+        if date_to:
+            query['_id']['$lte'] = date_to
+    rollups = await db.booking_rollups.find(query).sort("_id", 1).to_list(None)
+    
+    by_status = {booking_status.value: 0 for booking_status in BookingStatus}
+    by_service = {}
+    by_day = []
+    for rollup in rollups:
+        for status_name, count in rollup.get('statuses', {}).items():
+            by_status[status_name] = by_status.get(status_name, 0) + count
+        for service_id, totals in rollup.get('services', {}).items():
+            service_totals = by_service.setdefault(service_id, {"count": 0, "revenue": 0.0})
+            service_totals['count'] += totals.get('count', 0)
+            service_totals['revenue'] += totals.get('revenue', 0.0)
+        if rollup.get('total'):
+            by_day.append(DayAnalytics(date=rollup['_id'], total=rollup['total'], revenue=round(rollup.get('revenue', 0.0), 2)))
+    
+    return BookingAnalytics(
+        total=sum(rollup.get('total', 0) for rollup in rollups),
+        revenue=round(sum(rollup.get('revenue', 0.0) for rollup in rollups), 2),
+        by_status=by_status,
+        by_service=[
+            ServiceAnalytics(
+                service_id=service_id,
+                service_name=service_catalog.by_id.get(service_id, {}).get('name', ""),
+                count=totals['count'],
+                revenue=round(totals['revenue'], 2)
+            )
+            for service_id, totals in by_service.items()
+            if totals['count']
+        ],
+        by_day=by_day
+    )
+
+@api_router.post("/admin/analytics/rebuild")
+async def rebuild_booking_analytics(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    async with mongo_lock("rebuild_rollups") as acquired:
+        if not acquired:
+            raise HTTPException(status_code=409, detail="A rebuild is already running")
+        await rebuild_rollups()
+    return {"message": "Analytics rebuilt successfully"}
+
+@api_router.get("/admin/jobs/dead", response_model=List[DeadJob])
+async def get_dead_jobs(
+    current_user: User = Depends(get_current_user),
+    job_type: Optional[str] = Query(None, alias="type"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    query = {"type": job_type} if job_type else {}
+    jobs = await db.jobs_dead.find(query).sort("failed_at", -1).limit(limit).to_list(limit)
+    return [DeadJob(id=job['_id'], **job) for job in jobs]
+
+@api_router.post("/admin/jobs/dead/{job_id}/retry")
+async def retry_dead_job(job_id: str, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    job = await db.jobs_dead.find_one({"_id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    now = datetime.now(timezone.utc)
+    try:
+        await db.jobs.insert_one({
+            "_id": job['_id'],
+            "type": job['type'],
+            "payload": job['payload'],
+            "status": "queued",
+            "attempts": 0,
+            "run_at": now,
+            "available_at": now,
+            "created_at": job['created_at']
+        })
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Job is already queued")
+    await db.jobs_dead.delete_one({"_id": job_id})
+    metrics.observe_job_outcome(job['type'], "enqueued")
+    if job_worker is not None:
+        job_worker.wake()
+    return {"message": "Job requeued"}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    now = datetime.now(timezone.utc)
+    lines = [metrics.render()]
+    for name, value in (
+        ("user_cache_hits_total", user_cache.hits),
+        ("user_cache_misses_total", user_cache.misses),
+        ("password_tasks_pending", password_tasks_pending),
+        ("service_catalog_version", service_catalog.version),
+        ("jobs_ready", await db.jobs.count_documents({"status": "queued", "available_at": {"$lte": now}})),
+        ("jobs_scheduled", await db.jobs.count_documents({"status": "queued", "available_at": {"$gt": now}})),
+        ("jobs_running", await db.jobs.count_documents({"status": "running"})),
+        ("jobs_dead", await db.jobs_dead.estimated_document_count()),
+    ):
+        lines.append(f"{name} {value}\n")
+    return PlainTextResponse("".join(lines), media_type="text/plain; version=0.0.4")
+
 app.include_router(api_router)
 
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "Idempotent-Replayed"],
 )
 
 logging.basicConfig(
@@ -280,6 +3054,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def warm_up_mongo_pool():
+    connections = max(1, MONGO_WARMUP_CONNECTIONS)
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+    logger.info("Warmed up Mongo connection pool with %d concurrent pings", connections)
+
+async def startup_job_worker():
+    global job_worker
+    if JOB_WORKER_MODE != "inprocess":
+        return
+    job_worker = JobWorker(JOB_WORKER_CONCURRENCY)
+    background_tasks.append(job_worker.start())
+
+async def connect_database():
+    global client, db
+    client = create_mongo_client()
+    db = client[os.environ['DB_NAME']]
+    await warm_up_mongo_pool()
+
+async def startup():
+    await connect_database()
+    await startup_storage()
+    await startup_indexes()
+    await startup_invalidation_bus()
+    await startup_revocations()
+    await startup_migrations()
+    await startup_service_catalog()
+    await startup_analytics()
+    await startup_booking_events()
+    await startup_archiver()
+    await startup_job_worker()
+
+async def shutdown():
+    if job_worker is not None:
+        await job_worker.stop()
+    booking_events.close()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    client.close()
+    await geocoder.close()
+    password_executor.shutdown(wait=False)
\ No newline at end of file
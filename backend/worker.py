@@ -0,0 +1,27 @@
+import asyncio
+import signal
+
+import server
+
+# Run from backend/ alongside the API started with JOB_WORKER_MODE=external: python worker.py
+async def main():
+    await server.connect_database()
+    await server.startup_storage()
+    await server.startup_indexes()
+    await server.startup_invalidation_bus()
+    await server.load_service_catalog()
+    server.job_worker = server.JobWorker(server.JOB_WORKER_CONCURRENCY)
+    server.background_tasks.append(server.job_worker.start())
+    server.logger.info("Job worker %s started with concurrency %d", server.job_worker.worker_id, server.JOB_WORKER_CONCURRENCY)
+    
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+    
+    server.logger.info("Job worker %s shutting down", server.job_worker.worker_id)
+    await server.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
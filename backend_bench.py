@@ -0,0 +1,449 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List
+
+import httpx
+import uvicorn
+
+ROOT_DIR = Path(__file__).parent
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return round(ordered[index] * 1000, 3)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.status_codes = defaultdict(int)
+        self.errors = 0
+
+    def record(self, seconds, status_code=None):
+        self.latencies.append(seconds)
+        if status_code is None:
+            self.errors += 1
+            self.status_codes["exception"] += 1
+        else:
+            self.status_codes[str(status_code)] += 1
+            if status_code >= 500:
+                self.errors += 1
+
+    def summary(self, elapsed):
+        return {
+            "count": len(self.latencies),
+            "errors": self.errors,
+            "status_codes": dict(self.status_codes),
+            "throughput_rps": round(len(self.latencies) / elapsed, 2) if elapsed else None,
+            "p50_ms": percentile(self.latencies, 50),
+            "p95_ms": percentile(self.latencies, 95),
+            "p99_ms": percentile(self.latencies, 99),
+        }
+
+
+class CleaningServiceBenchmark:
+    def __init__(self, mongo, concurrency, requests_per_scenario, port):
+        self.mongo = mongo
+        self.concurrency = concurrency
+        self.requests_per_scenario = requests_per_scenario
+        self.port = port
+        self.base_url = f"http://127.0.0.1:{port}/api"
+        self.stats = defaultdict(EndpointStats)
+        self.server = None
+        self.app_server = None
+        self.users = []
+        self.admin_headers = None
+        self.booking_ids = []
+        self.services = []
+        self.scenario = None
+        self.workers = []
+        self.worker_urls = []
+
+    def load_app(self):
+        """Import backend.server against a local mongod or a mongomock stand-in"""
+        os.environ.setdefault('DB_NAME', f"bench_{int(time.time())}")
+        if self.mongo != "mongomock":
+            os.environ['MONGO_URL'] = self.mongo
+        sys.path.insert(0, str(ROOT_DIR))
+        from backend import server
+
+        if self.mongo == "mongomock":
+            from mongomock_motor import AsyncMongoMockClient
+            server.create_mongo_client = lambda: AsyncMongoMockClient(tz_aware=True)
+            # mongomock cannot create collections with a $jsonSchema validator
+            server.STORAGE_VALIDATION = False
+        if self.scenario == "credential-stuffing":
+            # uvicorn trusts X-Forwarded-For from 127.0.0.1, so each simulated attacker address gets its own bucket
+            server.RATE_LIMIT_IP_ENABLED = True
+        else:
+            server.RATE_LIMIT_ENABLED = False
+        self.server = server
+        self.services = server.DEFAULT_SERVICES
+
+    async def start(self):
+        """Serve the app from its own thread and event loop so client overhead stays out of server timings"""
+        self.load_app()
+        config = uvicorn.Config(self.server.app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        self.app_server = uvicorn.Server(config)
+        self.server_loop = asyncio.new_event_loop()
+        self.server_thread = threading.Thread(
+            target=self.server_loop.run_until_complete, args=(self.app_server.serve(),), daemon=True
+        )
+        self.server_thread.start()
+        while not self.app_server.started:
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        if self.mongo != "mongomock":
+            await self.on_server(self.server.client.drop_database(os.environ['DB_NAME']))
+        self.app_server.should_exit = True
+        await asyncio.to_thread(self.server_thread.join)
+
+    async def start_workers(self, count):
+        """Run separate uvicorn processes against one mongod, as gunicorn workers would"""
+        if self.mongo == "mongomock":
+            raise SystemExit("The coherence scenario needs a shared mongod: pass --mongo mongodb://...")
+        os.environ.setdefault('DB_NAME', f"bench_{int(time.time())}")
+        env = dict(os.environ, MONGO_URL=self.mongo, INVALIDATION_BUS_ENABLED="true", RATE_LIMIT_ENABLED="false")
+        async with httpx.AsyncClient(timeout=1) as http:
+            for i in range(count):
+                port = self.port + i
+                self.workers.append(await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning",
+                    cwd=ROOT_DIR / "backend", env=env
+                ))
+                self.worker_urls.append(f"http://127.0.0.1:{port}/api")
+                while True:
+                    try:
+                        if (await http.get(f"{self.worker_urls[-1]}/services")).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    await asyncio.sleep(0.1)
+
+    async def stop_workers(self):
+        for worker in self.workers:
+            worker.terminate()
+            await worker.wait()
+        from motor.motor_asyncio import AsyncIOMotorClient
+        await AsyncIOMotorClient(self.mongo).drop_database(os.environ['DB_NAME'])
+
+    async def on_server(self, coro):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.server_loop))
+
+    async def call(self, http, name, method, endpoint, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await http.request(method, f"{self.base_url}/{endpoint}", **kwargs)
+        except httpx.HTTPError:
+            self.stats[name].record(time.perf_counter() - start)
+            return None
+        self.stats[name].record(time.perf_counter() - start, response.status_code)
+        return response
+
+    async def seed_users(self, http, count):
+        """Register benchmark users and promote one admin"""
+        for i in range(count + 1):
+            email = f"bench{i}-{random.randrange(10 ** 9)}@example.com"
+            response = await http.post(f"{self.base_url}/auth/register", json={
+                "name": f"Bench User {i}",
+                "email": email,
+                "password": "BenchPass123!"
+            })
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            if i == 0:
+                user_id = response.json()['user']['id']
+                users_storage = self.server.users_storage
+                await self.on_server(self.server.db.users.update_one(
+                    users_storage.translate({"id": user_id}), users_storage.translate({"$set": {"role": "admin"}})
+                ))
+                self.server.user_cache.invalidate(user_id)
+                response = await http.post(f"{self.base_url}/auth/refresh", json={"refresh_token": response.json()['refresh_token']})
+                response.raise_for_status()
+                self.admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            else:
+                self.users.append((email, headers))
+
+    def booking_payload(self):
+        service = random.choice(self.services)
+        return {
+            "service_id": service['id'],
+            "booking_date": (date.today() + timedelta(days=random.randint(1, 365))).isoformat(),
+            "booking_time": random.choice(["08:00", "09:00", "10:00", "11:00", "12:00", "13:00"]),
+            "address": f"{random.randint(1, 999)} Bench Street, Test City",
+            "phone": "(555) 123-4567",
+            "notes": "Benchmark booking"
+        }
+
+    async def mixed_operation(self, http):
+        email, headers = random.choice(self.users)
+        roll = random.random()
+        if roll < 0.30:
+            await self.call(http, "GET /services", "GET", "services")
+        elif roll < 0.50:
+            response = await self.call(http, "POST /bookings", "POST", "bookings", json=self.booking_payload(), headers=headers)
+            if response is not None and response.status_code == 201:
+                self.booking_ids.append(response.json()['id'])
+        elif roll < 0.70:
+            await self.call(http, "GET /bookings/user", "GET", "bookings/user", headers=headers)
+        elif roll < 0.75:
+            await self.call(http, "POST /auth/login", "POST", "auth/login", json={"email": email, "password": "BenchPass123!"})
+        elif roll < 0.90:
+            await self.call(http, "GET /bookings/all", "GET", "bookings/all", headers=self.admin_headers)
+        elif self.booking_ids:
+            booking_id = random.choice(self.booking_ids)
+            status = random.choice(["confirmed", "completed"])
+            await self.call(
+                http, "PATCH /bookings/{id}/status", "PATCH", f"bookings/{booking_id}/status",
+                params={"status": status}, headers=self.admin_headers
+            )
+
+    async def run_workers(self, operation, http, total):
+        remaining = [total]
+
+        async def worker():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                await operation(http)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def scenario_mixed(self, http):
+        """Realistic mix of auth, catalog, booking and admin traffic"""
+        await self.seed_users(http, max(4, self.concurrency // 4))
+        await self.run_workers(self.mixed_operation, http, self.requests_per_scenario)
+
+    async def scenario_login_storm(self, http):
+        """Concurrent logins while probing GET /services latency"""
+        await self.seed_users(http, 4)
+        email, _ = self.users[0]
+
+        async def probe(name, stop):
+            while not stop.is_set():
+                await self.call(http, name, "GET", "services")
+                await asyncio.sleep(0.01)
+
+        stop = asyncio.Event()
+        baseline = asyncio.create_task(probe("GET /services (baseline)", stop))
+        await asyncio.sleep(1)
+        stop.set()
+        await baseline
+
+        async def login(http):
+            await self.call(http, "POST /auth/login", "POST", "auth/login", json={"email": email, "password": "BenchPass123!"})
+
+        stop = asyncio.Event()
+        during = asyncio.create_task(probe("GET /services (during storm)", stop))
+        await self.run_workers(login, http, self.requests_per_scenario)
+        stop.set()
+        await during
+
+    async def scenario_serialization(self, http):
+        """Compare the validated list response path with the orjson fast path on the same rows"""
+        from fastapi.encoders import jsonable_encoder
+        from pydantic import TypeAdapter
+        import orjson
+
+        await self.seed_users(http, 1)
+        _, headers = self.users[0]
+        user_id = (await http.get(f"{self.base_url}/auth/me", headers=headers)).json()['id']
+        rows = []
+        for _ in range(self.requests_per_scenario):
+            booking = self.server.Booking(user_id=user_id, user_email="", user_name="", service_name="", **self.booking_payload())
+            rows.append(booking.model_dump(exclude=self.server.BOOKING_DERIVED_FIELDS))
+        await self.on_server(self.server.db.bookings.insert_many([self.server.bookings_storage.to_doc(row) for row in rows]))
+
+        hydrated = [dict(row, user_email="bench@example.com", user_name="Bench User", service_name="Deep Cleaning") for row in rows]
+        adapter = TypeAdapter(List[self.server.Booking])
+        for _ in range(20):
+            start = time.perf_counter()
+            json.dumps(jsonable_encoder(adapter.validate_python(hydrated))).encode()
+            self.stats["serialize (validated response_model)"].record(time.perf_counter() - start, 200)
+
+            start = time.perf_counter()
+            orjson.dumps(hydrated)
+            self.stats["serialize (orjson fast path)"].record(time.perf_counter() - start, 200)
+
+        for _ in range(20):
+            await self.call(http, "GET /bookings/all?limit=1000", "GET", "bookings/all", params={"limit": 1000}, headers=self.admin_headers)
+            await self.call(http, "GET /bookings/user", "GET", "bookings/user", headers=headers)
+
+    async def scenario_credential_stuffing(self, http):
+        """Booking traffic latency before and during a login flood from rotating IPs, with rate limiting on"""
+        await self.seed_users(http, max(4, self.concurrency // 4))
+        targets = [email for email, _ in self.users] + [f"victim{i}@example.com" for i in range(200)]
+
+        async def booking_traffic(suffix, stop):
+            while not stop.is_set():
+                _, headers = random.choice(self.users)
+                if random.random() < 0.5:
+                    await self.call(http, f"POST /bookings ({suffix})", "POST", "bookings", json=self.booking_payload(), headers=headers)
+                else:
+                    await self.call(http, f"GET /bookings/user ({suffix})", "GET", "bookings/user", headers=headers)
+
+        async def run_traffic(suffix, attack):
+            stop = asyncio.Event()
+            legit = [asyncio.create_task(booking_traffic(suffix, stop)) for _ in range(max(1, self.concurrency // 4))]
+            await attack()
+            stop.set()
+            await asyncio.gather(*legit)
+
+        await run_traffic("baseline", lambda: asyncio.sleep(2))
+
+        async def stuff(http):
+            await self.call(
+                http, "POST /auth/login (attack)", "POST", "auth/login",
+                json={"email": random.choice(targets), "password": "Guess123!"},
+                headers={"X-Forwarded-For": f"203.0.113.{random.randrange(16)}"}
+            )
+
+        await run_traffic("during attack", lambda: self.run_workers(stuff, http, self.requests_per_scenario))
+
+    async def scenario_coherence(self, http):
+        """Delay between a write acknowledged by one worker and its effect on another worker"""
+        from motor.motor_asyncio import AsyncIOMotorClient
+        origin, peer = self.worker_urls
+        db = AsyncIOMotorClient(self.mongo)[os.environ['DB_NAME']]
+        self.load_app()
+        users_storage = self.server.users_storage
+        self.services = (await http.get(f"{origin}/services")).json()
+
+        async def register(role):
+            email = f"coherence-{role}-{random.randrange(10 ** 9)}@example.com"
+            response = await http.post(f"{origin}/auth/register", json={"name": role, "email": email, "password": "BenchPass123!"})
+            response.raise_for_status()
+            return email, response.json()
+
+        async def wait_until(check, timeout=5.0):
+            start = time.perf_counter()
+            while time.perf_counter() - start < timeout:
+                if await check():
+                    return time.perf_counter() - start
+                await asyncio.sleep(0.005)
+            return None
+
+        _, admin = await register("admin")
+        await db.users.update_one(users_storage.translate({"id": admin['user']['id']}), users_storage.translate({"$set": {"role": "admin"}}))
+        admin = (await http.post(f"{origin}/auth/refresh", json={"refresh_token": admin['refresh_token']})).json()
+        admin_headers = {"Authorization": f"Bearer {admin['access_token']}"}
+        target_email, target = await register("user")
+        rounds = max(10, self.requests_per_scenario // 100)
+
+        for i in range(rounds):
+            login = await http.post(f"{origin}/auth/login", json={"email": target_email, "password": "BenchPass123!"})
+            headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+            response = await http.patch(
+                f"{origin}/users/{target['user']['id']}/role", json={"role": "admin" if i % 2 == 0 else "user"}, headers=admin_headers
+            )
+            response.raise_for_status()
+
+            async def rejected_on_peer():
+                return (await http.get(f"{peer}/auth/me", headers=headers)).status_code == 401
+
+            delay = await wait_until(rejected_on_peer)
+            self.stats["role change -> token rejected on peer"].record(delay or 5.0, 200 if delay is not None else None)
+
+        arrivals = {}
+
+        async def listen():
+            async with http.stream("GET", f"{peer}/admin/bookings/events", params={"token": admin['access_token']}, timeout=None) as stream:
+                async for line in stream.aiter_lines():
+                    if line.startswith("data: "):
+                        event = json.loads(line[6:])
+                        if event['type'] == "created":
+                            arrivals[event['booking']['id']] = time.perf_counter()
+
+        listener = asyncio.create_task(listen())
+        await asyncio.sleep(0.5)
+        for _ in range(rounds):
+            response = await http.post(f"{origin}/bookings", json=self.booking_payload(), headers=admin_headers)
+            acknowledged = time.perf_counter()
+            if response.status_code != 201:
+                continue
+            booking_id = response.json()['id']
+
+            async def delivered():
+                return booking_id in arrivals
+
+            delay = await wait_until(delivered)
+            if delay is not None:
+                delay = max(0.0, arrivals[booking_id] - acknowledged)
+            self.stats["booking created -> SSE event on peer"].record(delay or 5.0, 200 if delay is not None else None)
+        listener.cancel()
+
+    async def run(self, scenario):
+        self.scenario = scenario
+        if scenario == "coherence":
+            return await self.run_workers_scenario(scenario)
+        await self.start()
+        limits = httpx.Limits(max_connections=self.concurrency + 2, max_keepalive_connections=self.concurrency + 2)
+        try:
+            async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+                start = time.perf_counter()
+                await getattr(self, f"scenario_{scenario.replace('-', '_')}")(http)
+                elapsed = time.perf_counter() - start
+        finally:
+            await self.stop()
+
+        return self.report(scenario, elapsed)
+
+    async def run_workers_scenario(self, scenario):
+        await self.start_workers(2)
+        try:
+            async with httpx.AsyncClient(timeout=30) as http:
+                start = time.perf_counter()
+                await getattr(self, f"scenario_{scenario}")(http)
+                elapsed = time.perf_counter() - start
+        finally:
+            await self.stop_workers()
+        return self.report(scenario, elapsed)
+
+    def report(self, scenario, elapsed):
+        return {
+            "scenario": scenario,
+            "mongo": "mongomock" if self.mongo == "mongomock" else "mongod",
+            "concurrency": self.concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "endpoints": {name: stats.summary(elapsed) for name, stats in sorted(self.stats.items())},
+        }
+
+
+SCENARIOS = ["mixed", "login-storm", "serialization", "credential-stuffing", "coherence"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the CleanSpace API and report per-endpoint latency as JSON")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--mongo", default="mongomock", help="mongodb:// URL of a local mongod, or 'mongomock'")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests issued by the scenario's workers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    benchmark = CleaningServiceBenchmark(args.mongo, args.concurrency, args.requests, args.port)
+    report = asyncio.run(benchmark.run(args.scenario))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
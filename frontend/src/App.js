@@ -15,6 +15,49 @@ export const API = `${BACKEND_URL}/api`;
 
 export const AuthContext = createContext();
 
+let refreshRequest = null;
+
+export function refreshAccessToken() {
+  if (!refreshRequest) {
+    refreshRequest = axios
+      .post(`${API}/auth/refresh`, { refresh_token: localStorage.getItem('refresh_token') })
+      .then(({ data }) => {
+        localStorage.setItem('token', data.access_token);
+        localStorage.setItem('refresh_token', data.refresh_token);
+        return data.access_token;
+      })
+      .finally(() => {
+        refreshRequest = null;
+      });
+  }
+  return refreshRequest;
+}
+
+axios.interceptors.response.use(
+  response => response,
+  async error => {
+    const original = error.config;
+    if (
+      error.response?.status === 401 &&
+      original &&
+      !original._retry &&
+      !original.url.endsWith('/auth/refresh') &&
+      localStorage.getItem('refresh_token')
+    ) {
+      original._retry = true;
+      try {
+        const token = await refreshAccessToken();
+        original.headers.Authorization = `Bearer ${token}`;
+        return axios(original);
+      } catch (refreshError) {
+        localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
+      }
+    }
+    return Promise.reject(error);
+  }
+);
+
 function ProtectedRoute({ children }) {
   const token = localStorage.getItem('token');
   if (!token) {
@@ -38,6 +81,7 @@ function App() {
       })
       .catch(() => {
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
       })
       .finally(() => {
         setLoading(false);
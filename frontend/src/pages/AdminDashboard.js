@@ -1,4 +1,4 @@
-import { useState, useEffect, useContext ,useCallback} from 'react';
+import { useState, useEffect, useContext, useCallback, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { motion } from 'framer-motion';
@@ -12,30 +12,26 @@ import {
   SelectValue,
 } from '@/components/ui/select';
 import { toast } from 'sonner';
-import { API, AuthContext } from '../App';
+import { API, AuthContext, refreshAccessToken } from '../App';
 
 export default function AdminDashboard() {
   const navigate = useNavigate();
   const { user, setUser } = useContext(AuthContext);
   const [bookings, setBookings] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [analytics, setAnalytics] = useState(null);
   const [loading, setLoading] = useState(true);
+  const analyticsTimer = useRef(null);
 
-  useEffect(() => {
-    if (user?.role !== 'admin') {
-      toast.error('Access denied');
-      navigate('/dashboard');
-      return;
-    }
-    fetchAllBookings();
-  }, [user,navigate,fetchAllBookings]);
-
-  const fetchAllBookings = useCallback(async () => {
+  const fetchAllBookings = useCallback(async (cursor = null) => {
   try {
     const token = localStorage.getItem('token');
     const response = await axios.get(`${API}/bookings/all`, {
-      headers: { Authorization: `Bearer ${token}` }
+      headers: { Authorization: `Bearer ${token}` },
+      params: cursor ? { cursor } : {}
     });
-    setBookings(response.data);
+    setBookings(prev => cursor ? [...prev, ...response.data] : response.data);
+    setNextCursor(response.headers['x-next-cursor'] || null);
   } catch (error) {
     toast.error('Failed to load bookings');
   } finally {
@@ -43,6 +39,88 @@ export default function AdminDashboard() {
   }
 }, []);
 
+  const fetchAnalytics = useCallback(async () => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await axios.get(`${API}/admin/analytics`, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      setAnalytics(response.data);
+    } catch (error) {
+      toast.error('Failed to load analytics');
+    }
+  }, []);
+
+  const scheduleAnalytics = useCallback(() => {
+    clearTimeout(analyticsTimer.current);
+    analyticsTimer.current = setTimeout(fetchAnalytics, 500);
+  }, [fetchAnalytics]);
+
+  const applyBookingEvent = useCallback((event) => {
+    const changed = event.booking;
+    switch (event.type) {
+      case 'reset':
+        fetchAllBookings();
+        fetchAnalytics();
+        return;
+      case 'created':
+        setBookings(prev => prev.some(b => b.id === changed.id) ? prev : [changed, ...prev]);
+        break;
+      case 'updated':
+      case 'cancelled':
+        setBookings(prev => prev.map(b => b.id === changed.id ? { ...b, status: changed.status } : b));
+        break;
+      case 'archived':
+        setBookings(prev => prev.filter(b => b.id !== changed.id));
+        return;
+      default:
+        return;
+    }
+    scheduleAnalytics();
+  }, [fetchAllBookings, fetchAnalytics, scheduleAnalytics]);
+
+  useEffect(() => {
+    if (user?.role !== 'admin') {
+      toast.error('Access denied');
+      navigate('/dashboard');
+      return;
+    }
+    fetchAllBookings();
+    fetchAnalytics();
+  }, [user, navigate, fetchAllBookings, fetchAnalytics]);
+
+  useEffect(() => {
+    if (user?.role !== 'admin') return;
+    let source = null;
+    let lastEventId = null;
+    let retryTimer = null;
+    let closed = false;
+
+    const connect = () => {
+      const params = new URLSearchParams({ token: localStorage.getItem('token') });
+      if (lastEventId) params.set('last_event_id', lastEventId);
+      source = new EventSource(`${API}/admin/bookings/events?${params}`);
+      source.onmessage = (message) => {
+        if (message.lastEventId) lastEventId = message.lastEventId;
+        applyBookingEvent(JSON.parse(message.data));
+      };
+      source.onerror = () => {
+        // The browser retries dropped connections itself; a rejected token closes the stream for good
+        if (closed || source.readyState !== EventSource.CLOSED) return;
+        retryTimer = setTimeout(() => {
+          refreshAccessToken().then(() => !closed && connect()).catch(() => {});
+        }, 3000);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      clearTimeout(analyticsTimer.current);
+      source?.close();
+    };
+  }, [user, applyBookingEvent]);
 
   const handleStatusChange = async (bookingId, newStatus) => {
     try {
@@ -53,24 +131,31 @@ export default function AdminDashboard() {
         { headers: { Authorization: `Bearer ${token}` } }
       );
       toast.success('Status updated successfully');
-      fetchAllBookings();
+      setBookings(prev => prev.map(b => b.id === bookingId ? { ...b, status: newStatus } : b));
     } catch (error) {
       toast.error('Failed to update status');
     }
   };
 
   const handleLogout = () => {
+    const token = localStorage.getItem('token');
+    axios.post(
+      `${API}/auth/logout`,
+      { refresh_token: localStorage.getItem('refresh_token') },
+      { headers: { Authorization: `Bearer ${token}` } }
+    ).catch(() => {});
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     setUser(null);
     toast.success('Logged out successfully');
     navigate('/');
   };
 
   const stats = {
-    total: bookings.length,
-    pending: bookings.filter(b => b.status === 'pending').length,
-    confirmed: bookings.filter(b => b.status === 'confirmed').length,
-    completed: bookings.filter(b => b.status === 'completed').length,
+    total: analytics?.total ?? 0,
+    pending: analytics?.by_status.pending ?? 0,
+    confirmed: analytics?.by_status.confirmed ?? 0,
+    completed: analytics?.by_status.completed ?? 0,
   };
 
   return (
@@ -181,7 +266,7 @@ export default function AdminDashboard() {
                         <div className="md:col-span-2">
                           <div className="text-sm text-muted-foreground mb-1">Status</div>
                           <Select
-                            defaultValue={booking.status}
+                            value={booking.status}
                             onValueChange={(value) => handleStatusChange(booking.id, value)}
                           >
                             <SelectTrigger data-testid={`status-select-${booking.id}`} className="w-full">
@@ -205,6 +290,17 @@ export default function AdminDashboard() {
                       )}
                     </motion.div>
                   ))}
+                  {nextCursor && (
+                    <div className="text-center">
+                      <Button
+                        data-testid="admin-load-more-btn"
+                        variant="outline"
+                        onClick={() => fetchAllBookings(nextCursor)}
+                      >
+                        Load more
+                      </Button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useMemo } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { motion } from 'framer-motion';
@@ -27,6 +27,8 @@ export default function BookingFlow() {
     notes: ''
   });
 
+  const idempotencyKey = useMemo(() => crypto.randomUUID(), [bookingData]);
+
   useEffect(() => {
     fetchServices();
   }, []);
@@ -66,7 +68,7 @@ export default function BookingFlow() {
     try {
       const token = localStorage.getItem('token');
       await axios.post(`${API}/bookings`, bookingData, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}`, 'Idempotency-Key': idempotencyKey }
       });
       toast.success('Booking confirmed successfully!');
       navigate('/dashboard');
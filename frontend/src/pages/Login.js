@@ -25,6 +25,7 @@ export default function Login() {
     try {
       const response = await axios.post(`${API}/auth/login`, formData);
       localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
       setUser(response.data.user);
       toast.success('Welcome back!');
       navigate('/dashboard');
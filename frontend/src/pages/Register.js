@@ -26,6 +26,7 @@ export default function Register() {
     try {
       const response = await axios.post(`${API}/auth/register`, formData);
       localStorage.setItem('token', response.data.access_token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
       setUser(response.data.user);
       toast.success('Account created successfully!');
       navigate('/dashboard');
@@ -47,7 +47,14 @@ export default function UserDashboard() {
   };
 
   const handleLogout = () => {
+    const token = localStorage.getItem('token');
+    axios.post(
+      `${API}/auth/logout`,
+      { refresh_token: localStorage.getItem('refresh_token') },
+      { headers: { Authorization: `Bearer ${token}` } }
+    ).catch(() => {});
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     setUser(null);
     toast.success('Logged out successfully');
     navigate('/');
@@ -148,16 +155,18 @@ export default function UserDashboard() {
                         </div>
                       </div>
 
-                      <Button
-                        data-testid={`cancel-booking-btn-${booking.id}`}
-                        variant="destructive"
-                        size="sm"
-                        onClick={() => handleCancelBooking(booking.id)}
-                        className="w-full rounded-full"
-                      >
-                        <Trash2 className="w-4 h-4 mr-2" />
-                        Cancel Booking
-                      </Button>
+                      {(booking.status === 'pending' || booking.status === 'confirmed') && (
+                        <Button
+                          data-testid={`cancel-booking-btn-${booking.id}`}
+                          variant="destructive"
+                          size="sm"
+                          onClick={() => handleCancelBooking(booking.id)}
+                          className="w-full rounded-full"
+                        >
+                          <Trash2 className="w-4 h-4 mr-2" />
+                          Cancel Booking
+                        </Button>
+                      )}
                     </motion.div>
                   ))}
                 </div>
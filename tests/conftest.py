@@ -0,0 +1,84 @@
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = AsyncMongoMockClient(tz_aware=True)
+    monkeypatch.setattr(server, "db", client[os.environ["DB_NAME"]])
+    server.idempotency_cache.clear()
+    server.user_cache.clear()
+    monkeypatch.setattr(server, "rate_limiter", server.MemoryRateLimiter(server.RATE_LIMIT_MAX_KEYS))
+    return server.db
+
+
+@pytest.fixture
+async def api(db):
+    await server.ensure_indexes()
+    await server.startup_service_catalog()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as http:
+        yield http
+
+
+@pytest.fixture
+def booking_body():
+    return {
+        "service_id": server.DEFAULT_SERVICES[0]["id"],
+        "booking_date": "2030-02-01",
+        "booking_time": "09:00",
+        "address": "1 Main St",
+        "phone": "555-0100",
+    }
+
+
+@pytest.fixture
+def register(api):
+    async def register(email: str) -> dict:
+        response = await api.post("/api/auth/register", json={"email": email, "password": "secret", "name": "Test"})
+        assert response.status_code == 201, response.text
+        return response.json()
+    return register
+
+
+@pytest.fixture
+async def admin(api, db, register):
+    tokens = await register("admin@example.com")
+    await db.users.update_one(server.users_storage.translate({"id": tokens["user"]["id"]}), {"$set": {"r": "admin"}})
+    # Roles travel in the access token, so take one issued after the promotion
+    refreshed = (await api.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})).json()
+    return {"id": tokens["user"]["id"], "headers": {"Authorization": f"Bearer {refreshed['access_token']}"}}
+
+
+@pytest.fixture
+def store_bookings(db):
+    # Writes bookings straight to storage, bypassing admission, for tests about reading them back
+    async def store(*bookings: dict, collection: str = "bookings"):
+        defaults = {
+            "user_id": "user-1",
+            "service_id": "service-1",
+            "booking_date": "2030-02-01",
+            "booking_time": "09:00",
+            "address": "1 Main St",
+            "phone": "555-0100",
+            "status": "pending",
+            "created_at": datetime(2030, 1, 1, tzinfo=timezone.utc),
+        }
+        await db[collection].insert_many([server.bookings_storage.to_doc({**defaults, **booking}) for booking in bookings])
+    return store
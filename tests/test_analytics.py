@@ -0,0 +1,44 @@
+import pytest
+
+import server
+
+
+@pytest.fixture
+def catalog(monkeypatch):
+    monkeypatch.setattr(server.service_catalog, "by_id", {"service-1": {"id": "service-1", "price": 50.0}})
+
+
+def test_rollup_increments_for_new_booking(catalog):
+    booking = {"service_id": "service-1"}
+    assert server.rollup_increments(booking, None, "pending") == {
+        "total": 1,
+        "services.service-1.count": 1,
+        "statuses.pending": 1,
+        "revenue": 50.0,
+        "services.service-1.revenue": 50.0,
+    }
+
+
+def test_rollup_increments_for_cancellation(catalog):
+    booking = {"service_id": "service-1"}
+    assert server.rollup_increments(booking, "confirmed", "cancelled") == {
+        "statuses.confirmed": -1,
+        "statuses.cancelled": 1,
+        "revenue": -50.0,
+        "services.service-1.revenue": -50.0,
+    }
+
+
+def test_rollup_increments_for_removal_of_cancelled_booking(catalog):
+    booking = {"service_id": "service-1"}
+    assert server.rollup_increments(booking, "cancelled", None) == {
+        "statuses.cancelled": -1,
+        "total": -1,
+        "services.service-1.count": -1,
+    }
+
+
+def test_rollup_increments_for_unknown_service():
+    booking = {"service_id": "retired"}
+    increments = server.rollup_increments(booking, "pending", "completed")
+    assert increments == {"statuses.pending": -1, "statuses.completed": 1}
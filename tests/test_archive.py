@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+CREATED = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+async def test_cancel_keeps_the_booking_and_frees_its_slots(api, db, register, booking_body, monkeypatch):
+    monkeypatch.setattr(server, "SLOT_CAPACITY", 1)
+    tokens = await register("cancel@example.com")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    booking_id = (await api.post("/api/bookings", headers=headers, json=booking_body)).json()["id"]
+    
+    first = await api.delete(f"/api/bookings/{booking_id}", headers=headers)
+    again = await api.delete(f"/api/bookings/{booking_id}", headers=headers)
+    
+    assert first.status_code == again.status_code == 200
+    booking = server.bookings_storage.from_doc(await db.bookings.find_one(server.bookings_storage.translate({"id": booking_id})))
+    assert booking["status"] == "cancelled"
+    # Cancelling twice must not release the slots twice
+    assert await server.reserve_slots(booking_body["booking_date"], ["09:00"])
+    assert not await server.reserve_slots(booking_body["booking_date"], ["09:00"])
+
+
+async def test_completed_bookings_cannot_be_cancelled(api, db, admin, store_bookings):
+    await store_bookings({"id": "done", "user_id": admin["id"], "status": "completed"})
+    
+    response = await api.delete("/api/bookings/done", headers=admin["headers"])
+    
+    assert response.status_code == 400
+    booking = server.bookings_storage.from_doc(await db.bookings.find_one(server.bookings_storage.translate({"id": "done"})))
+    assert booking["status"] == "completed"
+
+
+async def test_users_cannot_cancel_other_users_bookings(api, register, store_bookings):
+    tokens = await register("other@example.com")
+    await store_bookings({"id": "theirs", "user_id": "someone-else"})
+    
+    response = await api.delete("/api/bookings/theirs", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 403
+
+
+async def test_archiver_moves_only_old_finished_bookings(db, store_bookings):
+    old = (datetime.now(timezone.utc).date() - timedelta(days=server.ARCHIVE_AFTER_DAYS + 1)).isoformat()
+    await store_bookings(
+        {"id": "old-completed", "booking_date": old, "status": "completed"},
+        {"id": "old-cancelled", "booking_date": old, "status": "cancelled"},
+        {"id": "old-pending", "booking_date": old, "status": "pending"},
+        {"id": "recent-completed", "status": "completed"},
+    )
+    
+    assert await server.archive_bookings() == 2
+    
+    assert sorted(await db.bookings.distinct("i")) == ["old-pending", "recent-completed"]
+    assert sorted(await db.bookings_archive.distinct("i")) == ["old-cancelled", "old-completed"]
+
+
+async def test_include_archived_pages_across_hot_and_archived_bookings(api, register, store_bookings):
+    tokens = await register("history@example.com")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    user_id = tokens["user"]["id"]
+    # Interleave the two collections by creation time so every page draws from both
+    await store_bookings(*[
+        {"id": f"hot-{n}", "user_id": user_id, "created_at": CREATED + timedelta(minutes=2 * n)} for n in range(3)
+    ])
+    await store_bookings(*[
+        {"id": f"archived-{n}", "user_id": user_id, "status": "completed", "created_at": CREATED + timedelta(minutes=2 * n + 1)}
+        for n in range(3)
+    ], collection="bookings_archive")
+    
+    hot_only = await api.get("/api/bookings/user", headers=headers)
+    assert [booking["id"] for booking in hot_only.json()] == ["hot-2", "hot-1", "hot-0"]
+    
+    seen = []
+    params = {"limit": 2, "include_archived": "true"}
+    while True:
+        response = await api.get("/api/bookings/user", headers=headers, params=params)
+        assert response.status_code == 200, response.text
+        seen.extend(booking["id"] for booking in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    
+    assert seen == ["archived-2", "hot-2", "archived-1", "hot-1", "archived-0", "hot-0"]
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import orjson
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+CREATED = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+async def list_all(api, admin, **params):
+    response = await api.get("/api/bookings/all", headers=admin["headers"], params=params)
+    assert response.status_code == 200, response.text
+    return response
+
+
+async def test_cursor_pages_through_created_at_ties_without_gaps(api, admin, store_bookings):
+    # Five bookings share a timestamp; the id tie-breaker must keep pages disjoint and complete
+    await store_bookings(
+        *[{"id": f"tie-{n}", "created_at": CREATED} for n in range(5)],
+        {"id": "newer", "created_at": CREATED + timedelta(seconds=1)},
+        {"id": "older", "created_at": CREATED - timedelta(seconds=1)},
+    )
+    
+    seen = []
+    params = {"limit": 2}
+    while True:
+        response = await list_all(api, admin, **params)
+        seen.extend(booking["id"] for booking in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    
+    assert seen == ["newer", "tie-4", "tie-3", "tie-2", "tie-1", "tie-0", "older"]
+
+
+async def test_filters_combine(api, admin, store_bookings):
+    await store_bookings(
+        {"id": "match", "status": "confirmed", "booking_date": "2030-02-10", "service_id": "service-2"},
+        {"id": "wrong-status", "status": "pending", "booking_date": "2030-02-10", "service_id": "service-2"},
+        {"id": "too-late", "status": "confirmed", "booking_date": "2030-03-01", "service_id": "service-2"},
+        {"id": "other-service", "status": "confirmed", "booking_date": "2030-02-10", "service_id": "service-1"},
+    )
+    
+    response = await list_all(
+        api, admin, status="confirmed", date_from="2030-02-01", date_to="2030-02-28", service_id="service-2"
+    )
+    assert [booking["id"] for booking in response.json()] == ["match"]
+    assert response.json()[0]["service_name"]
+
+
+async def test_stream_returns_every_match_as_ndjson(api, admin, store_bookings):
+    await store_bookings(*[{"id": f"b{n}", "created_at": CREATED + timedelta(seconds=n)} for n in range(5)])
+    
+    response = await list_all(api, admin, stream="true", limit=1)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    ids = [orjson.loads(line)["id"] for line in response.content.splitlines()]
+    assert ids == ["b4", "b3", "b2", "b1", "b0"]
+
+
+async def test_invalid_cursor_is_rejected(api, admin):
+    response = await api.get("/api/bookings/all", headers=admin["headers"], params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+async def test_listing_all_bookings_requires_admin(api, register):
+    tokens = await register("plain@example.com")
+    response = await api.get("/api/bookings/all", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 403
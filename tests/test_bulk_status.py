@@ -0,0 +1,106 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def book(api, admin, booking_body, **overrides):
+    response = await api.post("/api/bookings", headers=admin["headers"], json={**booking_body, **overrides})
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+async def bulk_status(api, admin, body: dict):
+    response = await api.patch("/api/bookings/status", headers=admin["headers"], json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def statuses(db) -> dict:
+    bookings = map(server.bookings_storage.from_doc, await db.bookings.find({}, {"_id": 0}).to_list(None))
+    return {booking["id"]: booking["status"] for booking in bookings}
+
+
+async def test_bulk_update_reports_a_result_per_booking(api, db, admin, booking_body, monkeypatch):
+    monkeypatch.setattr(server, "SLOT_CAPACITY", 1)
+    confirmed = await book(api, admin, booking_body, booking_time="09:00")
+    pending = await book(api, admin, booking_body, booking_time="11:00")
+    reopened = await book(api, admin, booking_body, booking_time="13:00")
+    await api.delete(f"/api/bookings/{reopened}", headers=admin["headers"])
+    # Someone else takes the freed slot, so reopening the cancelled booking cannot fit
+    await book(api, admin, booking_body, booking_time="13:00")
+    await api.patch(f"/api/bookings/{confirmed}/status?status=confirmed", headers=admin["headers"])
+    
+    result = await bulk_status(api, admin, {"updates": [
+        {"booking_id": pending, "status": "confirmed"},
+        {"booking_id": confirmed, "status": "confirmed"},
+        {"booking_id": "missing", "status": "confirmed"},
+        {"booking_id": reopened, "status": "confirmed"},
+    ]})
+    
+    assert result["updated"] == 1
+    assert {item["booking_id"]: item["result"] for item in result["results"]} == {
+        pending: "updated",
+        confirmed: "unchanged",
+        "missing": "not_found",
+        reopened: "conflict",
+    }
+    current = await statuses(db)
+    assert current[pending] == "confirmed"
+    assert current[reopened] == "cancelled"
+
+
+async def test_bulk_cancel_releases_slots(api, db, admin, booking_body, monkeypatch):
+    monkeypatch.setattr(server, "SLOT_CAPACITY", 1)
+    booking_id = await book(api, admin, booking_body)
+    
+    result = await bulk_status(api, admin, {"updates": [{"booking_id": booking_id, "status": "cancelled"}]})
+    
+    assert result["updated"] == 1
+    assert await server.reserve_slots(booking_body["booking_date"], ["09:00"])
+
+
+async def test_bulk_update_by_filter_touches_only_matching_bookings(api, db, admin, booking_body):
+    in_range = await book(api, admin, booking_body, booking_date="2030-02-01")
+    other_service = await book(api, admin, booking_body, booking_date="2030-02-01", service_id="service-2")
+    out_of_range = await book(api, admin, booking_body, booking_date="2030-03-01")
+    
+    result = await bulk_status(api, admin, {
+        "filter": {"status": "pending", "date_from": "2030-02-01", "date_to": "2030-02-28", "service_id": "service-1"},
+        "status": "confirmed",
+    })
+    
+    assert result["updated"] == 1
+    assert [item["booking_id"] for item in result["results"]] == [in_range]
+    current = await statuses(db)
+    assert current == {in_range: "confirmed", other_service: "pending", out_of_range: "pending"}
+
+
+async def test_bulk_update_by_filter_pages_past_one_batch(api, db, admin, store_bookings, monkeypatch):
+    monkeypatch.setattr(server, "BULK_STATUS_BATCH_SIZE", 2)
+    await store_bookings(*[{"id": f"b{n}"} for n in range(5)])
+    
+    result = await bulk_status(api, admin, {"filter": {}, "status": "completed"})
+    
+    assert result["updated"] == 5
+    assert set((await statuses(db)).values()) == {"completed"}
+
+
+@pytest.mark.parametrize("body", [
+    {"updates": [{"booking_id": "b1", "status": "confirmed"}], "filter": {}, "status": "confirmed"},
+    {"filter": {"status": "pending"}},
+])
+async def test_bulk_update_rejects_ambiguous_requests(api, admin, body):
+    response = await api.patch("/api/bookings/status", headers=admin["headers"], json=body)
+    assert response.status_code == 400
+
+
+async def test_bulk_update_requires_admin(api, register):
+    tokens = await register("plain@example.com")
+    response = await api.patch(
+        "/api/bookings/status",
+        headers={"Authorization": f"Bearer {tokens['access_token']}"},
+        json={"updates": [{"booking_id": "b1", "status": "confirmed"}]},
+    )
+    assert response.status_code == 403
@@ -0,0 +1,79 @@
+import orjson
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def event(frame: bytes) -> dict:
+    return orjson.loads(frame.split(b"data: ", 1)[1])
+
+
+async def read(stream, count: int) -> list:
+    return [await stream.__anext__() for _ in range(count)]
+
+
+async def test_reconnect_replays_only_missed_events():
+    bus = server.BookingEventBus(size=10, queue_size=10)
+    seen = bus.publish("created", {"id": "b1"})
+    bus.publish("updated", {"id": "b1", "status": "confirmed"})
+    bus.publish("created", {"id": "b2"})
+    
+    stream = bus.stream(seen)
+    try:
+        retry, *missed = await read(stream, 3)
+        assert retry == f"retry: {server.BOOKING_EVENTS_RETRY_MS}\n\n".encode()
+        assert [event(frame) for frame in missed] == [
+            {"type": "updated", "booking": {"id": "b1", "status": "confirmed"}},
+            {"type": "created", "booking": {"id": "b2"}},
+        ]
+        assert missed[-1].startswith(f"id: {bus.epoch}-3\n".encode())
+        
+        # Live events follow the replay on the same connection
+        bus.publish("cancelled", {"id": "b2"})
+        assert event(await stream.__anext__())["type"] == "cancelled"
+    finally:
+        await stream.aclose()
+    assert not bus._subscribers
+
+
+async def test_unknown_last_event_id_asks_the_client_to_reset():
+    bus = server.BookingEventBus(size=2, queue_size=10)
+    evicted = bus.publish("created", {"id": "b1"})
+    bus.publish("created", {"id": "b2"})
+    bus.publish("created", {"id": "b3"})
+    
+    stream = bus.stream(evicted)
+    try:
+        _, frame = await read(stream, 2)
+        assert event(frame) == {"type": "reset"}
+    finally:
+        await stream.aclose()
+
+
+async def test_stalled_subscriber_is_disconnected_and_can_resume():
+    bus = server.BookingEventBus(size=10, queue_size=1)
+    stream = bus.stream(None)
+    await stream.__anext__()
+    
+    first = bus.publish("created", {"id": "b1"})
+    bus.publish("created", {"id": "b2"})
+    
+    # The overflowing publish drops the backlog and ends the stream instead of blocking publishers
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    
+    resumed = bus.stream(first)
+    try:
+        _, frame = await read(resumed, 2)
+        assert event(frame)["booking"] == {"id": "b2"}
+    finally:
+        await resumed.aclose()
+
+
+async def test_event_stream_requires_an_admin_token(api, register):
+    tokens = await register("plain@example.com")
+    
+    response = await api.get("/api/admin/bookings/events", params={"token": tokens["access_token"]})
+    assert response.status_code == 403
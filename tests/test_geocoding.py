@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_location_backfill_geocodes_claimable_bookings(db):
+    now = datetime.now(timezone.utc)
+    storage = server.bookings_storage
+    await db.bookings.insert_many([
+        storage.to_doc({"id": "pending", "address": "1 Main St", "geo_pending": now - timedelta(seconds=1)}),
+        storage.to_doc({"id": "claimed", "address": "2 Main St", "geo_pending": now + timedelta(minutes=1)}),
+        storage.to_doc({"id": "located", "address": "3 Main St", "location": None}),
+    ])
+    
+    await server.backfill_booking_locations({})
+    
+    bookings = {doc["i"]: doc for doc in await db.bookings.find({}).to_list(None)}
+    assert bookings["pending"]["l"]["type"] == "Point"
+    assert "gp" not in bookings["pending"]
+    # Another worker's live claim is left alone
+    assert "l" not in bookings["claimed"]
+    assert "gp" in bookings["claimed"]
+    assert bookings["located"]["l"] is None
+
+
+def test_upgrade_marks_bookings_without_a_location():
+    upgraded = server.bookings_storage.upgrade({"_id": "oid", "id": "b1", "address": "1 Main St"})
+    assert "gp" in upgraded
+    located = server.bookings_storage.upgrade({"_id": "oid", "id": "b1", "location": None})
+    assert "gp" not in located
+
+
+class FakeGeocoder:
+    def __init__(self, remote=False, fail=False, result=server.geo_point(-73.9, 40.7)):
+        self.remote = remote
+        self.fail = fail
+        self.result = result
+        self.calls = []
+
+    async def geocode(self, address):
+        self.calls.append(address)
+        if self.fail:
+            raise ConnectionError("geocoder unavailable")
+        return self.result
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def use_geocoder(monkeypatch):
+    server.geocode_cache.clear()
+    
+    def use(geocoder):
+        monkeypatch.setattr(server, "geocoder", geocoder)
+        return geocoder
+    return use
+
+
+async def create_booking(api, register, booking_body, email):
+    tokens = await register(email)
+    response = await api.post("/api/bookings", headers={"Authorization": f"Bearer {tokens['access_token']}"}, json=booking_body)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+async def test_failed_geocoding_is_retried_by_the_backfill(api, db, register, booking_body, use_geocoder):
+    use_geocoder(FakeGeocoder(fail=True))
+    booking = await create_booking(api, register, booking_body, "fail@example.com")
+    
+    stored = await db.bookings.find_one({"i": booking["id"]})
+    assert stored["l"] is None
+    assert "gp" in stored
+    job = await db.jobs.find_one({"_id": f"backfill_locations:{booking['id']}"})
+    assert job["payload"] == {"booking_id": booking["id"]}
+    
+    use_geocoder(FakeGeocoder())
+    await server.backfill_booking_locations(job["payload"])
+    stored = await db.bookings.find_one({"i": booking["id"]})
+    assert stored["l"]["type"] == "Point"
+    assert "gp" not in stored
+
+
+async def test_remote_geocoder_is_not_called_while_creating(api, db, register, booking_body, use_geocoder):
+    geocoder = use_geocoder(FakeGeocoder(remote=True))
+    booking = await create_booking(api, register, booking_body, "remote@example.com")
+    
+    assert geocoder.calls == []
+    assert booking["location"] is None
+    assert "gp" in await db.bookings.find_one({"i": booking["id"]})
+    
+    await server.backfill_booking_locations({"booking_id": booking["id"]})
+    assert geocoder.calls == [booking_body["address"]]
+    # Now cached, so the next booking at the address is located inline
+    second = await create_booking(api, register, {**booking_body, "booking_time": "13:00"}, "remote2@example.com")
+    assert second["location"]["type"] == "Point"
+    assert "gp" not in await db.bookings.find_one({"i": second["id"]})
+
+
+async def test_backfill_stores_no_match_and_retries_errors(db, use_geocoder):
+    now = datetime.now(timezone.utc) - timedelta(seconds=1)
+    await db.bookings.insert_many([
+        server.bookings_storage.to_doc({"id": "nowhere", "address": "Atlantis", "geo_pending": now}),
+    ])
+    
+    use_geocoder(FakeGeocoder(fail=True))
+    with pytest.raises(ConnectionError):
+        await server.backfill_booking_locations({})
+    stored = await db.bookings.find_one({"i": "nowhere"})
+    assert stored["gp"] > now
+    
+    await db.bookings.update_one({"i": "nowhere"}, {"$set": {"gp": now}})
+    use_geocoder(FakeGeocoder(result=None))
+    await server.backfill_booking_locations({})
+    stored = await db.bookings.find_one({"i": "nowhere"})
+    assert stored["l"] is None
+    assert "gp" not in stored
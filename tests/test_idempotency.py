@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_idempotent_create_replays_the_first_response(api, db, register, booking_body):
+    tokens = await register("idempotent@example.com")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}", "Idempotency-Key": "key-1"}
+    
+    first = await api.post("/api/bookings", headers=headers, json=booking_body)
+    server.idempotency_cache.clear()
+    replay = await api.post("/api/bookings", headers=headers, json=booking_body)
+    mismatch = await api.post("/api/bookings", headers=headers, json={**booking_body, "phone": "555-0199"})
+    
+    assert first.status_code == 201
+    assert replay.status_code == 201
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json()["id"] == first.json()["id"]
+    assert mismatch.status_code == 422
+    assert await db.bookings.count_documents({}) == 1
+
+
+async def test_idempotent_create_takes_over_an_expired_claim(api, db, register, booking_body):
+    tokens = await register("lease@example.com")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}", "Idempotency-Key": "key-1"}
+    user_id = tokens["user"]["id"]
+    
+    claim = await api.post("/api/bookings", headers=headers, json=booking_body)
+    assert claim.status_code == 201
+    server.idempotency_cache.clear()
+    await db.idempotency_keys.delete_many({})
+    await db.bookings.delete_many({})
+    
+    request_hash = server.hashlib.sha256(server.BookingCreate(**booking_body).model_dump_json().encode()).hexdigest()
+    now = datetime.now(timezone.utc)
+    await db.idempotency_keys.insert_one({
+        "_id": f"{user_id}:key-1",
+        "request_hash": request_hash,
+        "status": "in_progress",
+        "lease": "dead-worker",
+        "locked_until": now - timedelta(seconds=1),
+        "created_at": now - timedelta(minutes=5),
+    })
+    
+    response = await api.post("/api/bookings", headers=headers, json=booking_body)
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+    doc = await db.idempotency_keys.find_one({"_id": f"{user_id}:key-1"})
+    assert doc["status"] == "completed"
+    assert "lease" not in doc
+
+
+async def test_idempotent_create_refuses_a_live_claim(api, db, register, booking_body):
+    tokens = await register("busy@example.com")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}", "Idempotency-Key": "key-1"}
+    request_hash = server.hashlib.sha256(server.BookingCreate(**booking_body).model_dump_json().encode()).hexdigest()
+    now = datetime.now(timezone.utc)
+    await db.idempotency_keys.insert_one({
+        "_id": f"{tokens['user']['id']}:key-1",
+        "request_hash": request_hash,
+        "status": "in_progress",
+        "lease": "other-worker",
+        "locked_until": now + timedelta(seconds=30),
+        "created_at": now,
+    })
+    
+    response = await api.post("/api/bookings", headers=headers, json=booking_body)
+    assert response.status_code == 409
+    assert await db.bookings.count_documents({}) == 0
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def ndjson(*rows) -> str:
+    return "\n".join(json.dumps(row) for row in rows)
+
+
+async def import_rows(api, admin, body: str, import_format: str = "ndjson"):
+    response = await api.post(f"/api/admin/bookings/import?format={import_format}", headers=admin["headers"], content=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_import_reports_wrongly_typed_values_as_row_errors(api, db, admin, booking_body):
+    row = {**booking_body, "user_id": admin["id"]}
+    result = await import_rows(api, admin, ndjson(
+        {**row, "created_at": 1700000000},
+        {**row, "user_id": [admin["id"]]},
+        {**booking_body, "user_email": {"$gt": ""}},
+        {**row, "id": 7},
+        row,
+    ))
+    
+    assert (result["received"], result["inserted"], result["failed"]) == (5, 1, 4)
+    assert [error["row"] for error in result["errors"]] == [1, 2, 3, 4]
+    assert result["errors"][0]["error"] == "created_at: must be a string"
+    assert await db.bookings.count_documents({}) == 1
+
+
+async def test_import_admits_upcoming_bookings_against_slot_capacity(api, db, admin, booking_body, monkeypatch):
+    monkeypatch.setattr(server, "SLOT_CAPACITY", 3)
+    row = {**booking_body, "user_id": admin["id"]}
+    past = {**row, "booking_date": "2001-02-01"}
+    result = await import_rows(api, admin, ndjson(
+        *[row] * 4,
+        {**row, "status": "cancelled"},
+        *[past] * 4,
+    ))
+    
+    assert (result["inserted"], result["failed"]) == (8, 1)
+    assert result["errors"] == [{"row": 4, "error": "Selected time slot is fully booked"}]
+    day = await db.slot_occupancy.find_one({"_id": booking_body["booking_date"]})
+    assert set(day["slots"].values()) == {3}
+    # Past bookings are history: counted so a later cancel balances, but not refused
+    past_day = await db.slot_occupancy.find_one({"_id": "2001-02-01"})
+    assert set(past_day["slots"].values()) == {4}
+
+
+async def test_import_releases_slots_of_rows_that_fail_to_insert(api, db, admin, booking_body):
+    row = {**booking_body, "user_id": admin["id"], "id": "imported-1"}
+    await import_rows(api, admin, ndjson(row))
+    result = await import_rows(api, admin, ndjson(row))
+    
+    assert result["errors"] == [{"row": 1, "error": "Duplicate booking id"}]
+    day = await db.slot_occupancy.find_one({"_id": booking_body["booking_date"]})
+    assert set(day["slots"].values()) == {1}
+
+
+ROUND_TRIP_FIELDS = ("id", "user_id", "service_id", "booking_date", "booking_time", "address", "phone", "notes", "status", "created_at")
+
+
+async def stored_bookings(db) -> list:
+    bookings = map(server.bookings_storage.from_doc, await db.bookings.find({}, {"_id": 0}).sort("i", 1).to_list(None))
+    return [{field: booking.get(field) for field in ROUND_TRIP_FIELDS} for booking in bookings]
+
+
+@pytest.mark.parametrize("export_format", ["csv", "ndjson"])
+async def test_export_then_import_round_trips_bookings(api, db, admin, store_bookings, export_format):
+    await store_bookings(
+        {"id": "b1", "user_id": admin["id"], "status": "confirmed", "notes": 'Gate code "42",\nring twice'},
+        {"id": "b2", "user_id": admin["id"], "booking_date": "2001-02-01", "status": "completed"},
+        {"id": "b3", "user_id": admin["id"], "service_id": "service-2", "status": "cancelled"},
+    )
+    before = await stored_bookings(db)
+    
+    exported = await api.get(f"/api/admin/bookings/export?format={export_format}", headers=admin["headers"])
+    assert exported.status_code == 200
+    await db.bookings.delete_many({})
+    result = await import_rows(api, admin, exported.text, export_format)
+    
+    assert (result["received"], result["inserted"], result["failed"]) == (3, 3, 0)
+    assert await stored_bookings(db) == before
+
+
+async def test_import_reports_invalid_rows_and_keeps_the_rest(api, db, admin, booking_body):
+    row = {**booking_body, "user_id": admin["id"]}
+    body = "\n".join([
+        json.dumps({**row, "service_id": "no-such-service"}),
+        json.dumps({**row, "user_id": "no-such-user"}),
+        "{not json",
+        json.dumps({**row, "booking_date": "02/01/2030"}),
+        json.dumps(["not", "an", "object"]),
+        json.dumps({key: value for key, value in row.items() if key != "phone"}),
+        json.dumps({**booking_body, "user_email": "admin@example.com"}),
+    ])
+    
+    result = await import_rows(api, admin, body)
+    
+    assert (result["received"], result["inserted"], result["failed"]) == (7, 1, 6)
+    errors = {error["row"]: error["error"] for error in result["errors"]}
+    assert errors[1] == "Unknown service"
+    assert errors[2] == "Unknown user"
+    assert errors[3] == errors[5] == "Row is not a valid JSON object"
+    assert errors[4].startswith("Invalid date")
+    assert errors[6].startswith("phone:")
+    stored = server.bookings_storage.from_doc(await db.bookings.find_one({}))
+    assert stored["user_id"] == admin["id"]
@@ -0,0 +1,22 @@
+import pytest
+
+import server
+
+
+@pytest.mark.anyio
+async def test_ensure_indexes_replaces_superseded_indexes(db):
+    await db.bookings.create_index([("u", 1), ("c", -1)])
+    
+    await server.ensure_indexes()
+    await server.ensure_indexes()
+    
+    keys = [info["key"] for info in (await db.bookings.index_information()).values()]
+    assert [("u", 1), ("c", -1), ("i", -1)] in keys
+    assert [("u", 1), ("c", -1)] not in keys
+
+
+@pytest.mark.parametrize("collection", ["bookings", "bookings_archive"])
+def test_user_bookings_index_covers_the_listing_sort(collection):
+    # Equality on user_id followed by BOOKINGS_SORT avoids an in-memory SORT per page
+    assert ([("user_id", 1), *server.BOOKINGS_SORT], {}) in server.INDEXES[collection]
+    assert (collection, {"user_id": "probe"}, server.BOOKINGS_SORT) in server.QUERY_SHAPES
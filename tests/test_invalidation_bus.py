@@ -0,0 +1,102 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def joined_bus() -> server.InvalidationBus:
+    # mongomock cannot create the capped collection start() expects, so join by hand
+    bus = server.InvalidationBus()
+    bus.enabled = True
+    bus.last_id = ObjectId.from_datetime(datetime(2000, 1, 1, tzinfo=timezone.utc))
+    return bus
+
+
+async def test_dispatch_runs_peer_handlers_and_skips_own_messages(db):
+    publisher, peer = joined_bus(), joined_bus()
+    cache = server.TTLCache(10, 60)
+    for bus in (publisher, peer):
+        cache.set(bus.worker_id, "stale")
+        bus.subscribe("users", lambda message, bus=bus: cache.invalidate(bus.worker_id))
+    
+    await publisher.publish("users", key="user-1")
+    messages = await db.invalidations.find({}).to_list(None)
+    for message in messages:
+        await publisher.dispatch(message)
+        await peer.dispatch(message)
+    
+    assert cache.get(publisher.worker_id) == "stale"
+    assert cache.get(peer.worker_id) is None
+    assert publisher.last_id == peer.last_id == messages[-1]["_id"]
+
+
+async def test_dispatch_ignores_redelivered_messages(db):
+    publisher, peer = joined_bus(), joined_bus()
+    calls = []
+    peer.subscribe("users", lambda message: calls.append(message["key"]))
+    
+    await publisher.publish_many("users", [("user-1", None), ("user-2", None)])
+    messages = await db.invalidations.find({}).to_list(None)
+    # Reopened cursors overlap by a second, so the same messages can arrive twice
+    for message in messages + messages:
+        await peer.dispatch(message)
+    
+    assert calls == ["user-1", "user-2"]
+
+
+async def test_dispatch_survives_failing_handler(db):
+    publisher, peer = joined_bus(), joined_bus()
+    calls = []
+    
+    def fail(message):
+        raise RuntimeError("boom")
+    
+    async def record(message):
+        calls.append(message["key"])
+    
+    peer.subscribe("services", fail)
+    peer.subscribe("services", record)
+    await publisher.publish("services", key="catalog")
+    for message in await db.invalidations.find({}).to_list(None):
+        await peer.dispatch(message)
+    
+    assert calls == ["catalog"]
+
+
+async def test_tailing_peer_sees_a_publish_within_a_bounded_delay(db):
+    publisher, peer = joined_bus(), joined_bus()
+    cache = server.TTLCache(10, 60)
+    cache.set("user-1", "stale")
+    invalidated = asyncio.Event()
+    
+    def invalidate(message):
+        cache.invalidate(message["key"])
+        invalidated.set()
+    
+    peer.subscribe("users", invalidate)
+    # As in start(): a tailable cursor needs a document to hold on to
+    await publisher.publish("noop")
+    tail = asyncio.create_task(peer.tail())
+    try:
+        await asyncio.sleep(0.1)
+        published = time.monotonic()
+        await publisher.publish("users", key="user-1")
+        # mongomock ignores TAILABLE_AWAIT, so this also covers tail() reopening an exhausted cursor
+        await asyncio.wait_for(invalidated.wait(), 1)
+        assert time.monotonic() - published < 1
+        assert cache.get("user-1") is None
+    finally:
+        tail.cancel()
+        await asyncio.gather(tail, return_exceptions=True)
+
+
+async def test_disabled_bus_does_not_publish(db):
+    bus = server.InvalidationBus()
+    await bus.publish("users", key="user-1")
+    assert await db.invalidations.count_documents({}) == 0
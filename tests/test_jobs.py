@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    calls = []
+    
+    async def flaky(payload: dict):
+        calls.append(payload)
+        if payload.get("fail"):
+            raise ConnectionError("transport down")
+    
+    monkeypatch.setitem(server.JOB_HANDLERS, "flaky", flaky)
+    return calls
+
+
+async def make_due(db, job_id: str):
+    await db.jobs.update_one({"_id": job_id}, {"$set": {"available_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+
+
+async def test_completed_job_is_removed(db, handler):
+    await server.enqueue_job("flaky", {"n": 1}, key="ok")
+    worker = server.JobWorker(1)
+    
+    await worker.execute(await worker.claim())
+    
+    assert handler == [{"n": 1}]
+    assert await db.jobs.count_documents({}) == 0
+    assert await worker.claim() is None
+
+
+async def test_failed_job_is_requeued_with_backoff(db, handler, monkeypatch):
+    monkeypatch.setattr(server.random, "uniform", lambda low, high: high)
+    await server.enqueue_job("flaky", {"fail": True}, key="retry")
+    worker = server.JobWorker(1)
+    
+    for attempt in (1, 2, 3):
+        before = datetime.now(timezone.utc)
+        job = await worker.claim()
+        assert job["attempts"] == attempt
+        await worker.execute(job)
+        
+        job = await db.jobs.find_one({"_id": "flaky:retry"})
+        assert job["status"] == "queued"
+        assert job["last_error"] == "ConnectionError: transport down"
+        assert "lease_id" not in job
+        # Exponential: base, then twice, then four times the base delay
+        delay = (job["available_at"] - before).total_seconds()
+        assert delay == pytest.approx(server.JOB_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1), abs=0.5)
+        assert await worker.claim() is None
+        await make_due(db, "flaky:retry")
+
+
+async def test_job_moves_to_the_dead_letter_queue_after_max_attempts(db, handler, monkeypatch):
+    monkeypatch.setattr(server, "JOB_MAX_ATTEMPTS", 2)
+    await server.enqueue_job("flaky", {"fail": True}, key="dead")
+    worker = server.JobWorker(1)
+    
+    await worker.execute(await worker.claim())
+    await make_due(db, "flaky:dead")
+    await worker.execute(await worker.claim())
+    
+    assert await db.jobs.count_documents({}) == 0
+    dead = await db.jobs_dead.find_one({"_id": "flaky:dead"})
+    assert dead["status"] == "dead"
+    assert dead["attempts"] == 2
+    assert dead["last_error"] == "ConnectionError: transport down"
+    assert len(handler) == 2
+
+
+async def test_lapsed_lease_is_taken_over_and_the_stale_worker_cannot_finish(db, handler):
+    await server.enqueue_job("flaky", {"n": 1}, key="lease")
+    stalled, rescuer = server.JobWorker(1), server.JobWorker(1)
+    
+    stale = await stalled.claim()
+    assert await rescuer.claim() is None
+    await make_due(db, "flaky:lease")
+    fresh = await rescuer.claim()
+    
+    assert fresh["attempts"] == 2
+    assert fresh["lease_id"] != stale["lease_id"]
+    # The stalled worker's completion no longer matches the lease, so the job stays with the rescuer
+    await stalled.execute(stale)
+    assert (await db.jobs.find_one({"_id": "flaky:lease"}))["lease_id"] == fresh["lease_id"]
+    await rescuer.execute(fresh)
+    assert await db.jobs.count_documents({}) == 0
+
+
+async def test_unknown_job_type_fails_instead_of_vanishing(db):
+    await server.enqueue_job("no-such-type", {}, key="x")
+    worker = server.JobWorker(1)
+    
+    await worker.execute(await worker.claim())
+    
+    job = await db.jobs.find_one({"_id": "no-such-type:x"})
+    assert job["last_error"] == "LookupError: No handler for job type no-such-type"
+
+
+async def test_enqueue_with_a_key_is_idempotent(db):
+    await server.enqueue_job("flaky", {"n": 1}, key="same")
+    await server.enqueue_job("flaky", {"n": 2}, key="same")
+    
+    assert [job["payload"] for job in await db.jobs.find().to_list(None)] == [{"n": 1}]
+
+
+async def test_admin_can_list_and_retry_dead_jobs(api, db, admin, handler, monkeypatch):
+    monkeypatch.setattr(server, "JOB_MAX_ATTEMPTS", 1)
+    await server.enqueue_job("flaky", {"fail": True}, key="dead")
+    worker = server.JobWorker(1)
+    await worker.execute(await worker.claim())
+    
+    listed = await api.get("/api/admin/jobs/dead", headers=admin["headers"])
+    assert [job["id"] for job in listed.json()] == ["flaky:dead"]
+    
+    await server.enqueue_job("flaky", {"fail": True}, key="dead")
+    conflict = await api.post("/api/admin/jobs/dead/flaky:dead/retry", headers=admin["headers"])
+    assert conflict.status_code == 409
+    assert await db.jobs_dead.count_documents({}) == 1
+    
+    await db.jobs.delete_many({})
+    retried = await api.post("/api/admin/jobs/dead/flaky:dead/retry", headers=admin["headers"])
+    assert retried.status_code == 200
+    assert await db.jobs_dead.count_documents({}) == 0
+    job = await worker.claim()
+    assert (job["_id"], job["attempts"]) == ("flaky:dead", 1)
+    
+    missing = await api.post("/api/admin/jobs/dead/missing/retry", headers=admin["headers"])
+    assert missing.status_code == 404
+
+
+async def test_booking_confirmation_goes_through_the_transport(api, db, register, booking_body, monkeypatch):
+    transport = server.FakeNotificationTransport()
+    monkeypatch.setattr(server, "notification_transport", transport)
+    tokens = await register("confirm@example.com")
+    await api.post("/api/bookings", headers={"Authorization": f"Bearer {tokens['access_token']}"}, json=booking_body)
+    worker = server.JobWorker(1)
+    
+    while (job := await worker.claim()) is not None:
+        await worker.execute(job)
+    
+    assert [message["recipient"] for message in transport.sent] == ["confirm@example.com"]
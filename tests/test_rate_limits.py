@@ -0,0 +1,54 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_memory_rate_limiter_allows_burst_then_rejects(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: clock[0])
+    limiter = server.MemoryRateLimiter(maxsize=10)
+    
+    assert [await limiter.take("login:email:a", 2, 1.0) for _ in range(2)] == [0.0, 0.0]
+    assert await limiter.take("login:email:a", 2, 1.0) == pytest.approx(1.0)
+    # Other keys have their own bucket
+    assert await limiter.take("login:email:b", 2, 1.0) == 0.0
+    
+    clock[0] += 0.5
+    assert await limiter.take("login:email:a", 2, 1.0) == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert await limiter.take("login:email:a", 2, 1.0) == 0.0
+
+
+async def test_memory_rate_limiter_evicts_least_recent_keys():
+    limiter = server.MemoryRateLimiter(maxsize=2)
+    for key in ("a", "b", "a", "c"):
+        await limiter.take(key, 1, 0.001)
+    
+    assert list(limiter._buckets) == ["a", "c"]
+
+
+async def test_mongo_rate_limiter_allows_burst_then_rejects(db):
+    limiter = server.MongoRateLimiter()
+    
+    assert [await limiter.take("login:email:a", 2, 0.01) for _ in range(2)] == [0.0, 0.0]
+    assert await limiter.take("login:email:a", 2, 0.01) > 0
+    assert await limiter.take("login:email:b", 2, 0.01) == 0.0
+
+
+async def test_login_limit_rejects_by_email_without_spending_ip_budget(api, register, monkeypatch):
+    limiter = server.MemoryRateLimiter(maxsize=100)
+    monkeypatch.setattr(server, "rate_limiter", limiter)
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(server, "RATE_LIMIT_IP_ENABLED", True)
+    monkeypatch.setattr(server, "RATE_LIMIT_EMAIL_BURST", 2)
+    
+    statuses = [
+        (await api.post("/api/auth/login", json={"email": "victim@example.com", "password": "guess"})).status_code
+        for _ in range(4)
+    ]
+    
+    assert statuses == [401, 401, 429, 429]
+    ip_tokens, _ = limiter._buckets["login:ip:127.0.0.1"]
+    assert int(ip_tokens) == server.RATE_LIMIT_IP_BURST - 2
@@ -0,0 +1,38 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_services_carry_an_etag_and_cache_control(api):
+    response = await api.get("/api/services")
+    assert response.status_code == 200
+    assert response.headers["etag"] == server.service_catalog.etag
+    assert response.headers["cache-control"] == server.SERVICES_CACHE_CONTROL
+    assert [service["id"] for service in response.json()] == [service["id"] for service in server.DEFAULT_SERVICES]
+
+
+@pytest.mark.parametrize("if_none_match", [
+    "{etag}",
+    "W/{etag}",
+    '"stale", {etag}',
+    "*",
+])
+async def test_matching_if_none_match_returns_304(api, if_none_match):
+    etag = (await api.get("/api/services")).headers["etag"]
+    
+    response = await api.get("/api/services", headers={"If-None-Match": if_none_match.format(etag=etag)})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+async def test_stale_etag_gets_the_new_catalog(api):
+    etag = (await api.get("/api/services")).headers["etag"]
+    server.service_catalog.load(server.DEFAULT_SERVICES[:1])
+    
+    response = await api.get("/api/services", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert len(response.json()) == 1
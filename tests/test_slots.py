@@ -0,0 +1,54 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_reserve_slots_admits_up_to_capacity(db, monkeypatch):
+    monkeypatch.setattr(server, "SLOT_CAPACITY", 2)
+    slots = ["09:00", "09:30"]
+    
+    assert await server.reserve_slots("2030-02-01", slots)
+    assert await server.reserve_slots("2030-02-01", slots)
+    assert not await server.reserve_slots("2030-02-01", slots)
+    # One full slot rejects the whole booking without touching the others
+    assert not await server.reserve_slots("2030-02-01", ["09:30", "10:00"])
+    
+    day = await db.slot_occupancy.find_one({"_id": "2030-02-01"})
+    assert day["slots"] == {"09:00": 2, "09:30": 2}
+
+
+async def test_release_slots_frees_capacity(db, monkeypatch):
+    monkeypatch.setattr(server, "SLOT_CAPACITY", 1)
+    
+    assert await server.reserve_slots("2030-02-01", ["09:00"])
+    assert not await server.reserve_slots("2030-02-01", ["09:00"])
+    await server.release_slots("2030-02-01", ["09:00"])
+    assert await server.reserve_slots("2030-02-01", ["09:00"])
+
+
+def test_booking_slots_cover_the_service_duration():
+    assert server.booking_slots("09:15", 60) == ["09:00", "09:30", "10:00"]
+    with pytest.raises(server.HTTPException):
+        server.booking_slots(server.BUSINESS_CLOSE, 30)
+
+
+async def test_storage_upgrade_counts_upcoming_legacy_bookings(db, monkeypatch):
+    monkeypatch.setattr(server, "STORAGE_VALIDATION", False)
+    legacy = {"user_id": "u1", "service_id": "service-1", "address": "1 Main St", "phone": "555", "created_at": "2024-01-01T00:00:00"}
+    await db.bookings.insert_many([
+        {**legacy, "id": "upcoming", "booking_date": "2030-02-01", "booking_time": "09:00", "status": "confirmed"},
+        {**legacy, "id": "cancelled", "booking_date": "2030-02-01", "booking_time": "09:00", "status": "cancelled"},
+        {**legacy, "id": "past", "booking_date": "2001-02-01", "booking_time": "09:00", "status": "pending"},
+        {**legacy, "id": "unparseable", "booking_date": "2030-02-01", "booking_time": "noon", "status": "pending"},
+    ])
+    
+    await server.startup_storage()
+    await server.startup_storage()
+    
+    day = await db.slot_occupancy.find_one({"_id": "2030-02-01"})
+    assert day["slots"] == {"09:00": 1, "09:30": 1, "10:00": 1, "10:30": 1}
+    assert await db.slot_occupancy.find_one({"_id": "2001-02-01"}) is None
+    slots = {doc["i"]: doc.get("sl") for doc in await db.bookings.find({}).to_list(None)}
+    assert slots == {"upcoming": ["09:00", "09:30", "10:00", "10:30"], "cancelled": None, "past": None, "unparseable": None}
@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+bookings_storage = server.bookings_storage
+
+
+def test_translate_maps_fields_inside_operators():
+    spec = {
+        "$or": [{"status": "pending"}, {"booking_date": {"$gte": "2030-01-01"}}],
+        "location.coordinates": {"$exists": True},
+        "_id": 1,
+    }
+    assert bookings_storage.translate(spec) == {
+        "$or": [{"st": "pending"}, {"d": {"$gte": "2030-01-01"}}],
+        "l.coordinates": {"$exists": True},
+        "_id": 1,
+    }
+
+
+def test_translate_maps_update_operators_but_not_values():
+    update = {"$set": {"status": "confirmed", "notes": "status"}, "$unset": {"location": ""}}
+    assert bookings_storage.translate(update) == {"$set": {"st": "confirmed", "n": "status"}, "$unset": {"l": ""}}
+
+
+def test_sort_uses_short_names():
+    assert bookings_storage.sort([("booking_date", -1), ("_id", 1)]) == [("d", -1), ("_id", 1)]
+
+
+def test_to_doc_drops_derived_fields_and_round_trips():
+    data = {"id": "b1", "status": "pending", "service_name": "Basic House Cleaning", "user_email": "u@example.com"}
+    doc = bookings_storage.to_doc(data)
+    assert doc == {"i": "b1", "st": "pending", "v": server.STORAGE_SCHEMA_VERSION}
+    assert bookings_storage.from_doc(doc) == {"id": "b1", "status": "pending"}
+
+
+def test_upgrade_converts_version_one_documents():
+    legacy = {
+        "_id": "oid",
+        "id": "u1",
+        "email": "u@example.com",
+        "name": "User",
+        "role": "user",
+        "password": "hash",
+        "created_at": "2024-05-01T10:00:00",
+        "obsolete": True,
+    }
+    assert server.users_storage.upgrade(legacy) == {
+        "_id": "oid",
+        "i": "u1",
+        "e": "u@example.com",
+        "n": "User",
+        "r": "user",
+        "pw": "hash",
+        "c": datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc),
+        "v": server.STORAGE_SCHEMA_VERSION,
+    }
+
+
+def test_upgrade_keeps_aware_datetimes():
+    created_at = datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc)
+    upgraded = server.users_storage.upgrade({"_id": "oid", "id": "u1", "created_at": created_at})
+    assert upgraded["c"] == created_at
+
+
+def test_validator_requires_version_and_mandatory_fields():
+    schema = bookings_storage.validator()["$jsonSchema"]
+    assert "v" in schema["required"]
+    assert "st" in schema["required"]
+    assert "n" not in schema["required"]
+    assert schema["additionalProperties"] is False
+
+
+def test_validator_allows_bookings_without_slots():
+    # Bookings from before slot tracking are upgraded without slots and must still be archivable
+    assert "sl" not in bookings_storage.validator()["$jsonSchema"]["required"]
+
+
+@pytest.fixture
+def storage_startup(monkeypatch):
+    monkeypatch.setattr(server, "STORAGE_VALIDATION", False)
+    monkeypatch.setattr(server, "MIGRATION_WAIT_SECONDS", 0.01)
+
+
+@pytest.mark.anyio
+async def test_concurrent_startups_upgrade_documents_once(db, storage_startup):
+    await db.users.insert_one({"id": "u1", "email": "u@example.com", "name": "User", "role": "user", "password": "hash", "created_at": "2024-05-01T10:00:00"})
+    
+    await asyncio.gather(server.startup_storage(), server.startup_storage())
+    
+    assert await server.outdated_storage_collections() == []
+    assert await db.users.find_one({}, {"_id": 0}) == {
+        "i": "u1", "e": "u@example.com", "n": "User", "r": "user", "pw": "hash",
+        "c": datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc), "v": server.STORAGE_SCHEMA_VERSION,
+    }
+    assert await db.locks.count_documents({}) == 0
+
+
+@pytest.mark.anyio
+async def test_startup_waits_for_the_process_holding_the_migration_lock(db, storage_startup):
+    await db.locks.insert_one({"_id": "storage_migration", "token": "other", "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)})
+    
+    startup = asyncio.create_task(server.startup_storage())
+    await asyncio.sleep(0.05)
+    assert not startup.done()
+    
+    await db.storage_versions.insert_many([
+        {"_id": collection, "version": schema.version} for collection, schema in server.STORAGE_SCHEMAS.items()
+    ])
+    await asyncio.wait_for(startup, 1)
+
+
+@pytest.mark.anyio
+async def test_archiver_skips_documents_the_archive_rejects(db, monkeypatch):
+    monkeypatch.setattr(server, "ARCHIVE_BATCH_SIZE", 2)
+    storage = server.bookings_storage
+    await db.bookings.insert_many([
+        storage.to_doc({"id": booking_id, "status": "completed", "booking_date": "2000-01-01"})
+        for booking_id in ("b1", "bad", "b2", "b3")
+    ])
+    collection_class = type(db.bookings_archive)
+    insert_many = collection_class.insert_many
+    
+    # mongomock has no $jsonSchema validation, so reject one document the way the server would
+    async def reject_bad(collection, docs, ordered=True):
+        if collection.name != "bookings_archive":
+            return await insert_many(collection, docs, ordered=ordered)
+        accepted = [doc for doc in docs if doc["i"] != "bad"]
+        if accepted:
+            await insert_many(collection, accepted)
+        errors = [{"index": index, "code": 121, "errmsg": "Document failed validation"} for index, doc in enumerate(docs) if doc["i"] == "bad"]
+        if errors:
+            raise server.BulkWriteError({"writeErrors": errors})
+    
+    monkeypatch.setattr(collection_class, "insert_many", reject_bad)
+    
+    assert await server.archive_bookings() == 3
+    assert await db.bookings.distinct("i") == ["bad"]
+    assert sorted(await db.bookings_archive.distinct("i")) == ["b1", "b2", "b3"]
@@ -0,0 +1,36 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_refresh_rotates_tokens(api, register):
+    tokens = await register("rotate@example.com")
+    
+    response = await api.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    assert response.json()["refresh_token"] != tokens["refresh_token"]
+
+
+async def test_refresh_token_reuse_revokes_the_family(api, db, register):
+    tokens = await register("reuse@example.com")
+    rotated = (await api.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})).json()
+    
+    reused = await api.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert reused.status_code == 401
+    # The legitimate holder's newer token dies with the family
+    response = await api.post("/api/auth/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 401
+    assert await db.refresh_tokens.count_documents({"used": False}) == 0
+
+
+async def test_logout_revokes_the_access_token(api, register):
+    tokens = await register("logout@example.com")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    
+    response = await api.post("/api/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    assert (await api.get("/api/auth/me", headers=headers)).status_code == 401
+    refresh = await api.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert refresh.status_code == 401